@@ -0,0 +1,350 @@
+"""Admin CLI: stream tables of profiles.db in and out as NDJSON or CSV.
+
+    python admin.py tables
+    python admin.py export messages --format csv --out messages.csv
+    python admin.py import messages --in messages.csv --defer-indexes
+    python admin.py export messages --include-archive | gzip > messages.ndjson.gz
+
+Rows are read and written in chunks, so memory stays flat however large the
+table. Imports insert with ``executemany`` inside transactions of
+``--commit-every`` rows. ``--defer-indexes`` drops the table's non-unique
+indexes and triggers for the load, then rebuilds them in bulk along with
+any full-text index over the table and bumps the change counters the
+triggers would have. Unique indexes stay, since conflict handling needs
+them. In CSV, an empty field is NULL; an NDJSON record's missing keys get
+the column default. ``-`` means stdin/stdout, and progress goes to stderr.
+"""
+import argparse
+import csv
+import itertools
+import json
+import sqlite3
+import sys
+import time
+from typing import IO, Iterator, List, Optional, Sequence, Tuple
+
+import app as app_module
+
+# Full-text indexes whose content comes from a table; rebuilt after a deferred load.
+FTS_INDEXES = {"messages": "messages_fts", "profiles": "profiles_fts"}
+# data_versions names each table's triggers bump (app migration 4); bumped after a deferred load.
+VERSION_SCOPES = {
+    "profiles": "'profiles'",
+    "games": "'games'",
+    "friends": "'friends:' || owner_username",
+    "library": "'library:' || owner_username",
+}
+DEFERRED_PREFIX = "admin_deferred:"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=app_module.DB_BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{app_module.DB_CACHE_SIZE_KB * 4}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def list_tables(conn: sqlite3.Connection) -> List[str]:
+    """Ordinary tables, without SQLite internals and full-text shadow tables."""
+    rows = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+    virtual = [name for name, sql in rows if (sql or "").upper().startswith("CREATE VIRTUAL TABLE")]
+    return [
+        name for name, _ in rows
+        if not name.startswith("sqlite_") and name not in virtual and not any(name.startswith(v + "_") for v in virtual)
+    ]
+
+
+def quoted(names: Sequence[str]) -> str:
+    return ", ".join(f'"{n}"' for n in names)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    if table not in list_tables(conn):
+        raise SystemExit(f"unknown table {table!r}; see `python admin.py tables`")
+    return [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+class Progress:
+    """Rows done and rate on stderr, at most every ``every`` seconds."""
+
+    def __init__(self, label: str, every: float = 2.0):
+        self.label = label
+        self.every = every
+        self.started = time.perf_counter()
+        self.last = 0.0
+        self.rows = 0
+
+    def add(self, n: int) -> None:
+        self.rows += n
+        now = time.perf_counter()
+        if now - self.last >= self.every:
+            self.last = now
+            self.report()
+
+    def report(self, suffix: str = "") -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+        print(f"{self.label}: {self.rows:,} rows, {elapsed:.1f}s, {rate:,.0f} rows/s{suffix}", file=sys.stderr)
+
+
+def open_text(path: str, mode: str) -> IO[str]:
+    if path == "-":
+        return sys.stdout if "w" in mode else sys.stdin
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def read_records(fh: IO[str], fmt: str) -> Iterator[Tuple[Tuple[str, ...], Sequence]]:
+    """Lazy ``(columns, values)`` records; an NDJSON record names only the keys it has."""
+    if fmt == "csv":
+        reader = csv.reader(fh)
+        header = tuple(next(reader, None) or ())
+        for row in reader:
+            yield header, [v if v != "" else None for v in row]
+        return
+    for line in fh:
+        if line.strip():
+            obj = json.loads(line)
+            yield tuple(obj), list(obj.values())
+
+
+def write_records(fh: IO[str], fmt: str, columns: List[str], chunks: Iterator[List[Sequence]], progress: Progress) -> None:
+    writer = csv.writer(fh) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+    for chunk in chunks:
+        if writer is not None:
+            writer.writerows(["" if v is None else v for v in row] for row in chunk)
+        else:
+            fh.write("".join(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False, separators=(",", ":")) + "\n" for row in chunk
+            ))
+        progress.add(len(chunk))
+
+
+def export_table(args: argparse.Namespace) -> None:
+    conn = connect(args.db)
+    columns = table_columns(conn, args.table)
+    fmt = args.format or ("csv" if args.out.endswith(".csv") else "ndjson")
+    progress = Progress(f"export {args.table}")
+
+    def chunks() -> Iterator[List[Sequence]]:
+        if args.include_archive and args.table == "messages":
+            yield from archived_messages(conn, columns, args.archive, args.chunk)
+        cur = conn.execute(f'SELECT {quoted(columns)} FROM "{args.table}"')
+        while True:
+            rows = cur.fetchmany(args.chunk)
+            if not rows:
+                return
+            yield rows
+
+    fh = open_text(args.out, "w")
+    try:
+        write_records(fh, fmt, columns, chunks(), progress)
+    finally:
+        if fh is not sys.stdout:
+            fh.close()
+        conn.close()
+    progress.report(" (done)")
+
+
+def archived_messages(conn: sqlite3.Connection, columns: List[str], path: str, chunk: int) -> Iterator[List[Sequence]]:
+    """Rows of ``messages`` moved to archive segments, as if they were still in the table."""
+    archive = app_module.MessageArchive(path, cache_size=1)
+    batch: List[Sequence] = []
+    for channel_id, first_id in conn.execute("SELECT channel_id, first_id FROM message_segments ORDER BY channel_id, first_id"):
+        for m in archive.load(channel_id, first_id):
+            row = {"id": m["id"], "channel_id": channel_id, "sender": m["sender"], "text": m["text"], "created_at": m["createdAt"]}
+            batch.append([row.get(c) for c in columns])
+        if len(batch) >= chunk:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def restore_deferred(conn: sqlite3.Connection, table: Optional[str] = None) -> None:
+    """Recreate indexes and triggers a deferred load dropped, e.g. after it was interrupted."""
+    if table is None:
+        rows = conn.execute("SELECT name, value FROM sync_state WHERE name LIKE ?", (DEFERRED_PREFIX + "%",)).fetchall()
+    else:
+        rows = conn.execute("SELECT name, value FROM sync_state WHERE name = ?", (DEFERRED_PREFIX + table,)).fetchall()
+    for name, value in rows:
+        saved = json.loads(value)
+        label = name[len(DEFERRED_PREFIX):]
+        print(f"rebuilding {len(saved)} indexes and triggers on {label}", file=sys.stderr)
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Indexes first: triggers don't depend on them, and rebuilding them is the slow part.
+            for kind, object_name, sql in sorted(saved, key=lambda s: s[0] != "index"):
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (object_name,)).fetchone() is None:
+                    conn.execute(sql)
+            fts = FTS_INDEXES.get(label)
+            if fts:
+                conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+                if fts == "messages_fts":
+                    conn.execute(
+                        "UPDATE sync_state SET value = (SELECT COALESCE(MAX(id), 0) FROM messages) WHERE name IN (?, ?)",
+                        (app_module.MESSAGE_FTS_DONE, app_module.MESSAGE_FTS_UNTIL),
+                    )
+                    # 'rebuild' only sees hot rows; archived segments are re-indexed below.
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+                        [
+                            (app_module.MESSAGE_FTS_SEGMENTS_DONE, "0"),
+                            (app_module.MESSAGE_FTS_SEGMENTS_UNTIL,
+                             str(conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM message_segments").fetchone()[0])),
+                        ],
+                    )
+            # Version-counter triggers were off: bump every counter the load could have moved,
+            # which also invalidates per-user caches keyed on them (e.g. owned games), and
+            # change the epoch every ETag includes.
+            scope = VERSION_SCOPES.get(label)
+            if scope:
+                conn.execute(
+                    f'INSERT INTO data_versions (name, version) SELECT DISTINCT {scope}, 1 FROM "{label}" WHERE true '
+                    "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+                )
+            conn.execute("UPDATE data_versions SET version = abs(random()) WHERE name = 'epoch'")
+            conn.execute("DELETE FROM sync_state WHERE name = ?", (name,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if label == "messages":
+            app_module.backfill_segment_search(conn)
+        print(f"rebuilt {label} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+def defer_indexes(conn: sqlite3.Connection, table: str) -> None:
+    saved = conn.execute(
+        "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+        "AND (type = 'trigger' OR (type = 'index' AND sql NOT LIKE 'CREATE UNIQUE%'))",
+        (table,),
+    ).fetchall()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Saved first, so an interrupted load can still be repaired by restore_deferred().
+        conn.execute(
+            "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (DEFERRED_PREFIX + table, json.dumps(saved))
+        )
+        for kind, name, _ in saved:
+            conn.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    print(f"deferred {len(saved)} indexes and triggers on {table}", file=sys.stderr)
+
+
+def import_table(args: argparse.Namespace) -> None:
+    app_module.migrate(args.db)
+    conn = connect(args.db)
+    restore_deferred(conn)
+    table_cols = table_columns(conn, args.table)
+    fmt = args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    fh = open_text(args.input, "r")
+    statements = {}
+
+    def insert_sql(columns: Tuple[str, ...]) -> str:
+        # Columns a record leaves out are left out of its INSERT, so their DEFAULTs apply.
+        if columns not in statements:
+            if not columns:
+                raise SystemExit(f"a record for {args.table} has no fields")
+            unknown = [c for c in columns if c not in table_cols]
+            if unknown:
+                raise SystemExit(f"columns not in {args.table}: {unknown}")
+            statements[columns] = (
+                f'INSERT OR {args.on_conflict.upper()} INTO "{args.table}" ({quoted(columns)}) '
+                f'VALUES ({", ".join("?" * len(columns))})'
+            )
+        return statements[columns]
+
+    try:
+        records = read_records(fh, fmt)
+        first = next(records, None)
+        if first is None:
+            print("nothing to import", file=sys.stderr)
+            return
+        insert_sql(first[0])
+        if args.defer_indexes:
+            defer_indexes(conn, args.table)
+        progress = Progress(f"import {args.table}")
+        in_txn = 0
+        chunk: List[Sequence] = []
+        chunk_columns = first[0]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for columns, row in itertools.chain([first], records):
+                if columns != chunk_columns or len(chunk) >= args.chunk:
+                    if chunk:
+                        conn.executemany(insert_sql(chunk_columns), chunk)
+                        progress.add(len(chunk))
+                        in_txn += len(chunk)
+                        chunk = []
+                    chunk_columns = columns
+                    if in_txn >= args.commit_every:
+                        conn.execute("COMMIT")
+                        conn.execute("BEGIN IMMEDIATE")
+                        in_txn = 0
+                chunk.append(row)
+            if chunk:
+                conn.executemany(insert_sql(chunk_columns), chunk)
+                progress.add(len(chunk))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            if args.defer_indexes:
+                restore_deferred(conn, args.table)
+        progress.report(" (done)")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.execute("PRAGMA optimize")
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+        conn.close()
+
+
+def show_tables(args: argparse.Namespace) -> None:
+    conn = connect(args.db)
+    for table in list_tables(conn):
+        print(f"{table}: {', '.join(table_columns(conn, table))}")
+    conn.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Bulk import/export for the app's SQLite tables.")
+    parser.add_argument("--db", default=app_module.DB_NAME)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("tables", help="list tables and their columns").set_defaults(func=show_tables)
+
+    exp = sub.add_parser("export", help="stream a table out")
+    exp.add_argument("table")
+    exp.add_argument("--out", default="-", help="file to write, or - for stdout")
+    exp.add_argument("--format", choices=["ndjson", "csv"], help="default: from the file extension, else ndjson")
+    exp.add_argument("--chunk", type=int, default=10_000, help="rows fetched per step")
+    exp.add_argument("--include-archive", action="store_true", help="messages: also export archived segments")
+    exp.add_argument("--archive", default=app_module.ARCHIVE_DB_PATH, help="archive file for --include-archive")
+    exp.set_defaults(func=export_table)
+
+    imp = sub.add_parser("import", help="stream rows into a table")
+    imp.add_argument("table")
+    imp.add_argument("--in", dest="input", default="-", help="file to read, or - for stdin")
+    imp.add_argument("--format", choices=["ndjson", "csv"], help="default: from the file extension, else ndjson")
+    imp.add_argument("--chunk", type=int, default=10_000, help="rows per executemany")
+    imp.add_argument("--commit-every", type=int, default=500_000, help="rows per transaction")
+    imp.add_argument("--on-conflict", choices=["abort", "ignore", "replace"], default="abort")
+    imp.add_argument("--defer-indexes", action="store_true", help="drop non-unique indexes and triggers until the load ends")
+    imp.set_defaults(func=import_table)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
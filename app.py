@@ -1,12 +1,39 @@
+import atexit
+import base64
+import difflib
+import functools
+import gzip
+import hashlib
+import io
+import json
 import sqlite3
 import os
-from typing import List, Optional, Set
-from flask import Flask, request, jsonify
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Set, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+import queue
+from flask import Flask, Response, g, has_app_context, has_request_context, redirect, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except Exception:
     requests = None
+    HTTPAdapter = None
+try:
+    import brotli
+except Exception:
+    brotli = None
+try:
+    from PIL import Image
+except Exception:
+    Image = None
 try:
     from dotenv import load_dotenv  
 except Exception:
@@ -16,34 +43,1837 @@ if load_dotenv:
 app = Flask(__name__)
 CORS(app)
 DB_NAME = "profiles.db"
+IGDB_BASE_URL = os.getenv("IGDB_BASE_URL", "https://api.igdb.com/v4")
+IGDB_POOL_SIZE = int(os.getenv("IGDB_POOL_SIZE", "16"))
+IGDB_CONNECT_TIMEOUT = float(os.getenv("IGDB_CONNECT_TIMEOUT", "3"))
+IGDB_TIMEOUTS = {
+    "store": float(os.getenv("IGDB_TIMEOUT_STORE", "12")),
+    "games": float(os.getenv("IGDB_TIMEOUT_GAMES", "10")),
+    "details": float(os.getenv("IGDB_TIMEOUT_DETAILS", "8")),
+    "seed": float(os.getenv("IGDB_TIMEOUT_SEED", "12")),
+    "sync": float(os.getenv("IGDB_TIMEOUT_SYNC", "30")),
+}
+# IGDB allows 4 requests/second per client; stay at that and queue the excess.
+IGDB_RATE = float(os.getenv("IGDB_RATE", "4"))
+IGDB_BURST = int(os.getenv("IGDB_BURST", "4"))
+IGDB_QUEUE_TIMEOUT = float(os.getenv("IGDB_QUEUE_TIMEOUT", "10"))
+TWITCH_TOKEN_URL = os.getenv("TWITCH_TOKEN_URL", "https://id.twitch.tv/oauth2/token")
+IGDB_TOKEN_TIMEOUT = float(os.getenv("IGDB_TOKEN_TIMEOUT", "10"))
+IGDB_TOKEN_REFRESH_MARGIN = float(os.getenv("IGDB_TOKEN_REFRESH_MARGIN", "300"))
+CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "256"))
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "900"))
+CATALOG_CACHE_STALE_TTL = float(os.getenv("CATALOG_CACHE_STALE_TTL", "86400"))
+GAME_DETAILS_CACHE_SIZE = int(os.getenv("GAME_DETAILS_CACHE_SIZE", "4096"))
+GAME_DETAILS_CACHE_TTL = float(os.getenv("GAME_DETAILS_CACHE_TTL", "21600"))
+GAME_BATCH_MAX = 50
+OWNED_CACHE_SIZE = int(os.getenv("OWNED_CACHE_SIZE", "10000"))
+OWNED_CACHE_TTL = float(os.getenv("OWNED_CACHE_TTL", "600"))
+CATALOG_SYNC_INTERVAL = float(os.getenv("CATALOG_SYNC_INTERVAL", "3600"))
+CATALOG_SYNC_PAGE_SIZE = 500
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "16"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+MESSAGE_WAIT_MAX = float(os.getenv("MESSAGE_WAIT_MAX", "30"))
+PAGE_LIMIT_MAX = 200
+MESSAGE_SINCE_MAX = 500
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "1000"))
+# Host-wide cache shared by every worker process; set to "" to keep caches per-process.
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", os.path.join(app.instance_path, "cache.db"))
+SHARED_CACHE_WAIT = float(os.getenv("SHARED_CACHE_WAIT", "15"))
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+# Part of every ETag; bump when a versioned response changes shape.
+ETAG_FORMAT = "3"
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "https://images.igdb.com/igdb/image/upload")
+# Public path of the /img route; set it when a proxy mounts the API elsewhere. "" links IGDB images directly.
+IMAGE_PROXY_PREFIX = os.getenv("IMAGE_PROXY_PREFIX", "/img")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_MAX_BYTES = 8 * 1024 * 1024
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_MAX_AGE = 365 * 86400
+# Poll for messages inserted by other worker processes; 0 disables (single process).
+MESSAGE_POLL_INTERVAL = float(os.getenv("MESSAGE_POLL_INTERVAL", "0"))
+# Message inserts queued while a commit runs always share the next one; a window
+# also waits for stragglers, which only pays off when commits fsync (synchronous=FULL).
+MESSAGE_COMMIT_WINDOW = float(os.getenv("MESSAGE_COMMIT_WINDOW_MS", "0")) / 1000.0
+MESSAGE_COMMIT_BATCH = 256
+# Messages older than this many days move to compressed archive segments; 0 keeps all history hot.
+# Archived messages keep their search index entries; hits read their text from the segment.
+MESSAGE_ARCHIVE_DAYS = float(os.getenv("MESSAGE_ARCHIVE_DAYS", "0"))
+MESSAGE_ARCHIVE_INTERVAL = float(os.getenv("MESSAGE_ARCHIVE_INTERVAL", "3600"))
+MESSAGE_SEGMENT_SIZE = int(os.getenv("MESSAGE_SEGMENT_SIZE", "1000"))
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", "archive.db")
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "64"))
+# A user is online while heartbeats keep arriving within PRESENCE_TTL seconds.
+PRESENCE_TTL = float(os.getenv("PRESENCE_TTL", "90"))
+PRESENCE_FLUSH_INTERVAL = float(os.getenv("PRESENCE_FLUSH_INTERVAL", "10"))
+# How often the flusher looks for timed-out sessions to mark offline.
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "60"))
+PRESENCE_QUERY_MAX = 200
+
+class Metrics:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {}
+        self._values: Dict[str, Dict[Tuple[Tuple[str, str], ...], Any]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]] = []
+
+    def counter(self, name: str, help_text: str) -> None:
+        self._meta[name] = ("counter", help_text, ())
+        self._values.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self._meta[name] = ("histogram", help_text, tuple(sorted(buckets)))
+        self._values.setdefault(name, {})
+
+    def collector(self, fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]) -> None:
+        """Register ``fn`` returning ``(name, type, help, labels, value)`` tuples."""
+        self._collectors.append(fn)
+
+    def inc(self, name: str, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self._meta[name][2]
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            series = self._values[name]
+            h = series.get(key)
+            if h is None:
+                h = series[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[0][i] += 1
+                    break
+            h[1] += value
+            h[2] += 1
+
+    @staticmethod
+    def _labels(pairs: Iterable[Tuple[str, Any]]) -> str:
+        parts = []
+        for k, v in pairs:
+            v = str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+            parts.append(f'{k}="{v}"')
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    @staticmethod
+    def _num(v: float) -> str:
+        if v == float("inf"):
+            return "+Inf"
+        return repr(float(v)) if isinstance(v, float) else str(v)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            snapshot = {name: {k: (v if not isinstance(v, list) else [list(v[0]), v[1], v[2]]) for k, v in series.items()}
+                        for name, series in self._values.items()}
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, v in snapshot[name].items():
+                if kind == "counter":
+                    lines.append(f"{name}{self._labels(key)} {self._num(v)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, v[0]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._labels(key + (('le', self._num(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{self._labels(key + (('le', '+Inf'),))} {v[2]}")
+                lines.append(f"{name}_sum{self._labels(key)} {self._num(v[1])}")
+                lines.append(f"{name}_count{self._labels(key)} {v[2]}")
+        declared = set()
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as ex:
+                print("metrics collector failed:", ex)
+                continue
+            for name, kind, help_text, labels, value in samples:
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{self._labels(sorted(labels.items()))} {self._num(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram("http_request_duration_seconds", "Request latency by route.")
+metrics.counter("http_requests_total", "Requests by route, method and status.")
+metrics.histogram("http_json_serialize_seconds", "Time spent serializing JSON response bodies.")
+metrics.histogram("sqlite_execute_seconds", "SQLite execute/executemany latency by statement kind.")
+metrics.histogram("igdb_request_seconds", "IGDB query latency by call name, including retries.")
+metrics.counter("igdb_requests_total", "IGDB queries by call name and outcome.")
+
+class SqliteSideFile:
+    """Pooled autocommit connections to a host-local SQLite file beside the main DB."""
+
+    SCHEMA: Tuple[str, ...] = ()
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._pid = os.getpid()
+
+    def _open(self) -> sqlite3.Connection:
+        # Cached payloads can carry credentials, so keep the file owner-only.
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        os.close(os.open(self.path, os.O_CREAT | os.O_RDWR, 0o600))
+        conn = sqlite3.connect(
+            self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, isolation_level=None, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+        return conn
+
+    @contextmanager
+    def _conn(self):
+        if self._pid != os.getpid():
+            # Forked from the process that opened these; never share them.
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        except Exception:
+            conn.close()
+            raise
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+
+class SharedCache(SqliteSideFile):
+    """Host-wide JSON key/value store in a small SQLite file."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+        "stored_at REAL NOT NULL, expires_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)",
+    )
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, size: int = 4):
+        super().__init__(path, size)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def owner(self) -> str:
+        return str(os.getpid())
+
+    def _failed(self, op: str, ex: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+        print(f"shared cache {op} failed:", ex)
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return ``(age_seconds, value)`` for a live entry, else None."""
+        if not self.path:
+            return None
+        try:
+            with self._conn() as conn:
+                row = conn.execute(
+                    "SELECT value, stored_at FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+        except Exception as ex:
+            self._failed("get", ex)
+            return None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return max(0.0, time.time() - row[1]), json.loads(row[0])
+
+    def put(self, key: str, value: Any, keep: float) -> None:
+        if not self.path:
+            return
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, stored_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, separators=(",", ":")), now, now + keep),
+                )
+                with self._lock:
+                    self._writes += 1
+                    purge = self._writes % 256 == 0
+                if purge:
+                    conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        except Exception as ex:
+            self._failed("put", ex)
+
+    def delete(self, key: str) -> None:
+        if not self.path:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        except Exception as ex:
+            self._failed("delete", ex)
+
+    def delete_prefix(self, prefix: str) -> None:
+        if not self.path:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        except Exception as ex:
+            self._failed("delete", ex)
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """Take or renew ``name`` for ``ttl`` seconds; False while another process holds it."""
+        if not self.path:
+            return True
+        now = time.time()
+        try:
+            with self._conn() as conn:
+                cur = conn.execute(
+                    """
+                    INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                    ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE leases.expires_at <= ? OR leases.owner = excluded.owner
+                    """,
+                    (name, self.owner, now + ttl, now),
+                )
+                return cur.rowcount > 0
+        except Exception as ex:
+            # Fail open: doing the work twice beats not doing it at all.
+            self._failed("lease", ex)
+            return True
+
+    def release_lease(self, name: str) -> None:
+        if not self.path:
+            return
+        try:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+        except Exception as ex:
+            self._failed("lease", ex)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path or None, "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+
+shared_cache = SharedCache()
+
+class IgdbTokenManager:
+    """In-memory Twitch app token with expiry tracking and single-flight refresh."""
+
+    SHARED_KEY = "igdb:token"
+
+    def __init__(self, refresh_margin: float = IGDB_TOKEN_REFRESH_MARGIN, shared: Optional[SharedCache] = None):
+        self.refresh_margin = refresh_margin
+        self.shared = shared
+        self._cond = threading.Condition()
+        self._token: Optional[str] = os.getenv("IGDB_ACCESS_TOKEN") or None
+        # A token handed to us via env has no known expiry; keep it until IGDB rejects it.
+        self._expires_at: float = float("inf") if self._token else 0.0
+        self._refreshing = False
+        self._generation = 0
+        self.refresh_count = 0
+
+    def expires_in(self) -> Optional[float]:
+        with self._cond:
+            if not self._token or self._expires_at == float("inf"):
+                return None
+            return max(0.0, self._expires_at - time.time())
+
+    def get(self) -> Optional[str]:
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._token and now < self._expires_at - self.refresh_margin:
+                    return self._token
+                if self._refreshing:
+                    if self._token and now < self._expires_at:
+                        return self._token
+                    gen = self._generation
+                    while self._refreshing and gen == self._generation:
+                        self._cond.wait(IGDB_TOKEN_TIMEOUT)
+                    return self._token
+                self._refreshing = True
+                break
+        token, expires_at = None, 0.0
+        try:
+            token, expires_at = self._fetch_shared()
+        finally:
+            with self._cond:
+                if token:
+                    self._token, self._expires_at = token, expires_at
+                elif self._token and time.time() >= self._expires_at:
+                    self._token = None
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+        with self._cond:
+            return self._token
+
+    def invalidate(self, token: Optional[str]) -> None:
+        """Drop ``token`` after IGDB rejected it, unless it was already replaced."""
+        with self._cond:
+            if token is None or token == self._token:
+                self._token = None
+                self._expires_at = 0.0
+        if self.shared is not None:
+            entry = self.shared.get(self.SHARED_KEY)
+            if entry is not None and (token is None or entry[1].get("token") == token):
+                self.shared.delete(self.SHARED_KEY)
+
+    def _fetch_shared(self):
+        """Adopt another worker's fresh token, or fetch one under the host-wide lease."""
+        shared = self.shared
+        if shared is None or not shared.enabled():
+            return self._fetch()
+        deadline = time.time() + IGDB_TOKEN_TIMEOUT
+        while True:
+            entry = shared.get(self.SHARED_KEY)
+            if entry is not None:
+                token, expires_at = entry[1].get("token"), float(entry[1].get("expiresAt") or 0.0)
+                if token and time.time() < expires_at - self.refresh_margin:
+                    return token, expires_at
+            if shared.acquire_lease(self.SHARED_KEY, IGDB_TOKEN_TIMEOUT * 2):
+                try:
+                    token, expires_at = self._fetch()
+                    if token:
+                        shared.put(self.SHARED_KEY, {"token": token, "expiresAt": expires_at}, expires_at - time.time())
+                    return token, expires_at
+                finally:
+                    shared.release_lease(self.SHARED_KEY)
+            if time.time() >= deadline:
+                return self._fetch()
+            time.sleep(0.05)
+
+    def _fetch(self):
+        client_id = os.getenv("IGDB_CLIENT_ID")
+        client_secret = os.getenv("IGDB_CLIENT_SECRET")
+        if not client_id or not client_secret or requests is None:
+            return None, 0.0
+        try:
+            resp = requests.post(
+                TWITCH_TOKEN_URL,
+                data={
+                    "client_id": client_id,
+                    "client_secret": client_secret,
+                    "grant_type": "client_credentials",
+                },
+                timeout=IGDB_TOKEN_TIMEOUT,
+            )
+            resp.raise_for_status()
+            data = resp.json()
+            token = data.get("access_token")
+            if token:
+                self.refresh_count += 1
+                try:
+                    expires_in = float(data.get("expires_in") or 3600)
+                except Exception:
+                    expires_in = 3600.0
+                return token, time.time() + expires_in
+        except Exception as ex:
+            print("Failed to obtain IGDB token:", ex)
+        return None, 0.0
+
+
+igdb_tokens = IgdbTokenManager(shared=shared_cache)
+
 
 def ensure_igdb_token() -> Optional[str]:
-    token = os.getenv("IGDB_ACCESS_TOKEN")
-    if token:
-        return token
-    client_id = os.getenv("IGDB_CLIENT_ID")
-    client_secret = os.getenv("IGDB_CLIENT_SECRET")
-    if not client_id or not client_secret or requests is None:
-        return None
-    try:
-        resp = requests.post(
-            "https://id.twitch.tv/oauth2/token",
-            data={
-                "client_id": client_id,
-                "client_secret": client_secret,
-                "grant_type": "client_credentials",
+    return igdb_tokens.get()
+
+class TokenBucket:
+    """Reservation-style token bucket for outbound request pacing."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = float(max(1, burst))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.delayed = 0
+        self.rejected = 0
+
+    def acquire(self, timeout: float) -> bool:
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait > timeout:
+                self._tokens += 1
+                self.rejected += 1
+                return False
+            if wait:
+                self.delayed += 1
+                self.waiting += 1
+                self.max_waiting = max(self.max_waiting, self.waiting)
+        if wait:
+            time.sleep(wait)
+            with self._lock:
+                self.waiting -= 1
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.capacity,
+                "queueDepth": self.waiting,
+                "maxQueueDepth": self.max_waiting,
+                "delayed": self.delayed,
+                "rejected": self.rejected,
+            }
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result: Any = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, "SingleFlight._Call"] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+                self.executed += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"inFlight": len(self._calls), "executed": self.executed, "coalesced": self.coalesced}
+
+
+class IgdbClient:
+    """Shared IGDB client: one pooled keep-alive session for every caller."""
+
+    def __init__(self, pool_size: int = IGDB_POOL_SIZE, timeouts: Optional[Dict[str, float]] = None):
+        self.pool_size = pool_size
+        self.timeouts = dict(IGDB_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.session = None
+        if requests is not None:
+            self.session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self._timings: Dict[str, dict] = {}
+        self.bucket = TokenBucket(IGDB_RATE, IGDB_BURST)
+        self.flights = SingleFlight()
+
+    def is_configured(self) -> bool:
+        return bool(self.session is not None and os.getenv("IGDB_CLIENT_ID") and ensure_igdb_token())
+
+    def _record(self, name: str, elapsed_ms: float, ok: bool) -> None:
+        metrics.observe("igdb_request_seconds", elapsed_ms / 1000.0, call=name)
+        metrics.inc("igdb_requests_total", call=name, outcome="ok" if ok else "error")
+        with self._lock:
+            t = self._timings.setdefault(
+                name, {"calls": 0, "errors": 0, "totalMs": 0.0, "maxMs": 0.0, "lastMs": 0.0}
+            )
+            t["calls"] += 1
+            if not ok:
+                t["errors"] += 1
+            t["totalMs"] += elapsed_ms
+            t["lastMs"] = elapsed_ms
+            t["maxMs"] = max(t["maxMs"], elapsed_ms)
+
+    def timings(self) -> Dict[str, dict]:
+        with self._lock:
+            out = {}
+            for name, t in self._timings.items():
+                row = {k: round(v, 2) if isinstance(v, float) else v for k, v in t.items()}
+                row["avgMs"] = round(t["totalMs"] / t["calls"], 2) if t["calls"] else 0.0
+                out[name] = row
+            return out
+
+    def scheduler_stats(self) -> dict:
+        return dict(self.bucket.stats(), **self.flights.stats())
+
+    def _post(self, endpoint: str, body: str, token: str, timeout: float):
+        if not self.bucket.acquire(IGDB_QUEUE_TIMEOUT):
+            raise RuntimeError("IGDB request queue timed out")
+        return self.session.post(
+            f"{IGDB_BASE_URL}/{endpoint}",
+            data=body,
+            headers={
+                "Client-ID": os.getenv("IGDB_CLIENT_ID") or "",
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+                "Content-Type": "text/plain",
             },
-            timeout=10,
+            timeout=(IGDB_CONNECT_TIMEOUT, timeout),
         )
-        resp.raise_for_status()
-        data = resp.json()
-        token = data.get("access_token")
-        if token:
-            os.environ["IGDB_ACCESS_TOKEN"] = token
-            return token
-    except Exception as ex:
-        print("Failed to obtain IGDB token:", ex)
-    return None
+
+    def query(self, body: str, name: str = "games", endpoint: str = "games", fallback: Optional[str] = None) -> list:
+        """POST an apicalypse query and return the decoded JSON array."""
+        if not self.is_configured():
+            raise RuntimeError("IGDB not configured")
+        return self.flights.do((endpoint, body, fallback), lambda: self._query(body, name, endpoint, fallback))
+
+    def _query(self, body: str, name: str, endpoint: str, fallback: Optional[str]) -> list:
+        timeout = self.timeouts.get(name, 10.0)
+        started = time.perf_counter()
+        ok = False
+        try:
+            token = ensure_igdb_token()
+            resp = self._post(endpoint, body, token, timeout)
+            if resp.status_code == 429:
+                # Another client on the same credentials used the budget; back off once.
+                try:
+                    delay = float(resp.headers.get("Retry-After") or 1.0)
+                except Exception:
+                    delay = 1.0
+                time.sleep(min(delay, IGDB_QUEUE_TIMEOUT))
+                resp = self._post(endpoint, body, token, timeout)
+            if resp.status_code in (401, 403):
+                igdb_tokens.invalidate(token)
+                token = ensure_igdb_token()
+                if token:
+                    resp = self._post(endpoint, body, token, timeout)
+            if not resp.ok:
+                print(f"IGDB {name} HTTP", resp.status_code, "->", resp.text[:300])
+                if resp.status_code == 400 and fallback:
+                    resp = self._post(endpoint, fallback, token, timeout)
+                if not resp.ok:
+                    resp.raise_for_status()
+            data = resp.json()
+            ok = True
+            return data
+        finally:
+            self._record(name, (time.perf_counter() - started) * 1000.0, ok)
+
+
+igdb = IgdbClient()
+
+class TtlLruCache:
+    """Bounded LRU cache with a TTL and stale-while-revalidate."""
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0.0,
+                 shared: Optional[SharedCache] = None, namespace: str = ""):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared if shared is not None and shared.enabled() else None
+        self.namespace = namespace
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: Set[Hashable] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.evictions = 0
+        self.refresh_errors = 0
+
+    def _put_locked(self, key: Hashable, value: Any, age: float = 0.0) -> None:
+        self._data[key] = (time.monotonic() - age, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{json.dumps(key, separators=(',', ':'))}"
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._put_locked(key, value)
+        if self.shared is not None:
+            self.shared.put(self._shared_key(key), value, self.ttl + self.stale_ttl)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+        if self.shared is not None:
+            if key is None:
+                self.shared.delete_prefix(f"{self.namespace}:")
+            else:
+                self.shared.delete(self._shared_key(key))
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> Tuple[float, Any]:
+        """Return ``(age, value)``, running ``loader`` at most once per host when shared."""
+        if self.shared is None:
+            return 0.0, loader()
+        skey = self._shared_key(key)
+        deadline = time.monotonic() + SHARED_CACHE_WAIT
+        while True:
+            entry = self.shared.get(skey)
+            if entry is not None and entry[0] < self.ttl:
+                return entry
+            if self.shared.acquire_lease(skey, SHARED_CACHE_WAIT):
+                try:
+                    value = loader()
+                    self.shared.put(skey, value, self.ttl + self.stale_ttl)
+                    return 0.0, value
+                finally:
+                    self.shared.release_lease(skey)
+            if time.monotonic() >= deadline:
+                return 0.0, loader()
+            time.sleep(0.05)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            age, value = self._load(key, loader)
+            with self._lock:
+                self._put_locked(key, value, age)
+        except Exception as ex:
+            with self._lock:
+                self.refresh_errors += 1
+            print("cache refresh failed for", key, "->", ex)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a cached value without loading; stale entries count as hits."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.ttl + self.stale_ttl:
+                    self._data.move_to_end(key)
+                    if age < self.ttl:
+                        self.hits += 1
+                    else:
+                        self.stale_hits += 1
+                    return entry[1]
+            self.misses += 1
+            return default
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry[0]
+                if age < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl:
+                    self._data.move_to_end(key)
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                    return entry[1]
+            self.misses += 1
+        if self.shared is not None:
+            entry = self.shared.get(self._shared_key(key))
+            if entry is not None:
+                age, value = entry
+                with self._lock:
+                    self.shared_hits += 1
+                    self._put_locked(key, value, age)
+                    if age >= self.ttl and key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return value
+        age, value = self._load(key, loader)
+        with self._lock:
+            self._put_locked(key, value, age)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "staleTtl": self.stale_ttl,
+                "hits": self.hits,
+                "staleHits": self.stale_hits,
+                "misses": self.misses,
+                "sharedHits": self.shared_hits,
+                "evictions": self.evictions,
+                "refreshErrors": self.refresh_errors,
+                "hitRatio": round((self.hits + self.stale_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+catalog_cache = TtlLruCache(
+    CATALOG_CACHE_SIZE, CATALOG_CACHE_TTL, CATALOG_CACHE_STALE_TTL, shared=shared_cache, namespace="catalog"
+)
+game_details_cache = TtlLruCache(GAME_DETAILS_CACHE_SIZE, GAME_DETAILS_CACHE_TTL)
+owned_games_cache = TtlLruCache(OWNED_CACHE_SIZE, OWNED_CACHE_TTL)
+# Serialized, encoded bodies of versioned responses keyed by (ETag, encoding).
+response_cache = TtlLruCache(RESPONSE_CACHE_SIZE, 600)
+
+def _sql_kind(sql: str) -> str:
+    head = sql.lstrip().split(None, 1)
+    return head[0].lower() if head else "unknown"
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe("sqlite_execute_seconds", time.perf_counter() - started, op=_sql_kind(sql))
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe("sqlite_execute_seconds", time.perf_counter() - started, op=_sql_kind(sql))
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose statements are timed into ``sqlite_execute_seconds``."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class SqlitePool:
+    """Reusable SQLite connections, tuned once when opened."""
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = max(1, size)
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.opened = 0
+        self.reused = 0
+
+    def _check_fork(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked from the process that opened these (e.g. a preloaded master); never share them.
+                self._idle = queue.LifoQueue()
+                self._pid = os.getpid()
+                self.opened = 0
+                self.reused = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False, factory=TimedConnection
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        self._check_fork()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+        with self._lock:
+            self.reused += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        self._check_fork()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            return
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": self.size, "idle": self._idle.qsize(), "opened": self.opened, "reused": self.reused}
+
+
+db_pool = SqlitePool(DB_NAME)
+
+def get_db() -> sqlite3.Connection:
+    """Connection for the current request, returned to the pool on teardown."""
+    if "db" not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+def release_db() -> None:
+    """Return the request's connection early, e.g. before blocking on a long-poll."""
+    conn = g.pop("db", None)
+    if conn is not None:
+        db_pool.release(conn)
+
+@app.teardown_appcontext
+def _release_db(exc):
+    release_db()
+
+@contextmanager
+def db_connection():
+    """Pooled connection for helpers that may run inside or outside a request."""
+    if has_app_context():
+        yield get_db()
+        return
+    conn = db_pool.acquire()
+    try:
+        yield conn
+    finally:
+        db_pool.release(conn)
+
+def data_versions(conn: sqlite3.Connection, names: List[str]) -> Tuple[int, ...]:
+    """Current change counters for ``names`` (see migration 4); unknown names are 0."""
+    marks = ",".join("?" * len(names))
+    found = dict(conn.execute(f"SELECT name, version FROM data_versions WHERE name IN ({marks})", names).fetchall())
+    return tuple(found.get(n, 0) for n in names)
+
+ENCODING_SUFFIXES = {"gzip": "-gzip", "br": "-br"}
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+def _negotiate_encoding() -> Optional[str]:
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+def _encode_body(body: bytes, encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if not encoding or len(body) < COMPRESS_MIN_SIZE:
+        return body, None
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY), "br"
+    return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+
+def _encoded_response(body: bytes, encoding: Optional[str], etag: Optional[str] = None) -> Response:
+    resp = Response(body, mimetype="application/json")
+    resp.vary.add("Accept-Encoding")
+    if encoding:
+        resp.headers["Content-Encoding"] = encoding
+    if etag:
+        resp.headers["ETag"] = etag
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+def conditional(scopes: Callable[..., Optional[List[str]]]):
+    """Give a GET view a strong ETag derived from ``data_versions`` counters."""
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            names = scopes(*args, **kwargs)
+            if names is None:
+                return view(*args, **kwargs)
+            names = ["epoch"] + names
+            versions = data_versions(get_db(), names)
+            variant = (ETAG_FORMAT, request.path, sorted(request.args.items(multi=True)), names, versions)
+            # Each negotiated encoding is its own representation, so the suffix is part of the tag
+            # on both the 200 and the 304, and a gzip tag never validates an identity request.
+            wanted = _negotiate_encoding()
+            etag = '"' + hashlib.sha1(repr(variant).encode()).hexdigest()[:32] + ENCODING_SUFFIXES.get(wanted, "") + '"'
+            if _etag_matches(request.headers.get("If-None-Match"), etag):
+                resp = Response(status=304)
+                resp.headers["ETag"] = etag
+                resp.headers["Cache-Control"] = "no-cache"
+                resp.vary.add("Accept-Encoding")
+                return resp
+            cached = response_cache.get((etag, wanted))
+            if cached is None:
+                resp = app.make_response(view(*args, **kwargs))
+                if resp.status_code != 200 or resp.mimetype != "application/json":
+                    return resp
+                cached = _encode_body(resp.get_data(), wanted)
+                response_cache.put((etag, wanted), cached)
+            return _encoded_response(cached[0], cached[1], etag)
+        return wrapper
+    return decorate
+
+@app.after_request
+def _compress_response(response):
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.mimetype != "application/json"
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    encoded, encoding = _encode_body(body, _negotiate_encoding())
+    if encoding:
+        response.set_data(encoded)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+class MessageBroker:
+    """In-process pub/sub for new channel messages."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: Dict[int, int] = {}
+        self._conds: Dict[int, threading.Condition] = {}
+        self._waiters: Dict[int, int] = {}
+        self.published = 0
+        self.wakeups = 0
+        self.timeouts = 0
+        self._poller: Optional[threading.Thread] = None
+        self.poll_interval = 0.0
+
+    def latest(self, channel_id: int) -> Optional[int]:
+        with self._lock:
+            return self._latest.get(channel_id)
+
+    def observe(self, channel_id: int, message_id: int) -> None:
+        with self._lock:
+            if message_id > self._latest.get(channel_id, -1):
+                self._latest[channel_id] = message_id
+
+    def publish(self, channel_id: int, message_id: int) -> None:
+        with self._lock:
+            if message_id > self._latest.get(channel_id, -1):
+                self._latest[channel_id] = message_id
+            self.published += 1
+            cond = self._conds.get(channel_id)
+            if cond is not None:
+                cond.notify_all()
+
+    def wait(self, channel_id: int, since_id: int, timeout: float) -> bool:
+        """Block until a message newer than ``since_id`` exists; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            cond = self._conds.get(channel_id)
+            if cond is None:
+                cond = self._conds[channel_id] = threading.Condition(self._lock)
+            self._waiters[channel_id] = self._waiters.get(channel_id, 0) + 1
+            try:
+                while self._latest.get(channel_id, -1) <= since_id:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        return False
+                    cond.wait(remaining)
+                self.wakeups += 1
+                return True
+            finally:
+                self._waiters[channel_id] -= 1
+                if not self._waiters[channel_id]:
+                    del self._waiters[channel_id]
+                    del self._conds[channel_id]
+
+    def _poll(self) -> None:
+        high = None
+        while True:
+            try:
+                with db_connection() as conn:
+                    if high is None:
+                        high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+                    else:
+                        rows = conn.execute(
+                            "SELECT channel_id, MAX(id) FROM messages WHERE id > ? GROUP BY channel_id", (high,)
+                        ).fetchall()
+                        for channel_id, message_id in rows:
+                            self.publish(channel_id, message_id)
+                            high = max(high, message_id)
+            except Exception as ex:
+                print("message poll failed:", ex)
+            time.sleep(self.poll_interval)
+
+    def start_polling(self, interval: float) -> None:
+        if self._poller and self._poller.is_alive():
+            return
+        self.poll_interval = interval
+        self._poller = threading.Thread(target=self._poll, name="message-poll", daemon=True)
+        self._poller.start()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "channels": len(self._latest),
+                "pollInterval": self.poll_interval,
+                "waiters": sum(self._waiters.values()),
+                "published": self.published,
+                "wakeups": self.wakeups,
+                "timeouts": self.timeouts,
+            }
+
+
+message_broker = MessageBroker()
+
+class MessageWriter:
+    """Single writer thread that group-commits chat message inserts."""
+
+    def __init__(self, window: float = MESSAGE_COMMIT_WINDOW, batch: int = MESSAGE_COMMIT_BATCH):
+        self.window = window
+        self.batch = max(1, batch)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[int, str, str, Optional[str], Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self.commits = 0
+        self.written = 0
+        self.failed = 0
+        self.largest_batch = 0
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # The writer thread didn't survive fork; anything queued in the parent is gone with it.
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, channel_id: int, sender: str, text: str, client_id: Optional[str] = None) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((channel_id, sender, text, client_id, fut))
+        return fut
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            pending = [q.get()]
+            deadline = time.monotonic() + self.window
+            while len(pending) < self.batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    pending.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(pending)
+
+    def _write(self, pending: List[Tuple[int, str, str, Optional[str], Future]]) -> None:
+        stored = []
+        replays = []
+        try:
+            with db_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for channel_id, sender, text, client_id, fut in pending:
+                        try:
+                            rows = conn.execute(
+                                "INSERT INTO messages (channel_id, sender, text, client_id) VALUES (?, ?, ?, ?) "
+                                "ON CONFLICT (channel_id, client_id) WHERE client_id IS NOT NULL DO NOTHING "
+                                "RETURNING id, created_at",
+                                (channel_id, sender, text, client_id),
+                            ).fetchall()
+                        except sqlite3.IntegrityError as ex:
+                            # Only this row is rejected; the rest of the batch still commits.
+                            fut.set_exception(ex)
+                            continue
+                        if not rows:
+                            # A retried send: answer with the row the first attempt stored.
+                            row = conn.execute(
+                                "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? AND client_id = ?",
+                                (channel_id, client_id),
+                            ).fetchone()
+                            replays.append((fut, {"id": row[0], "sender": row[1], "text": row[2], "createdAt": row[3]}))
+                            continue
+                        row = rows[0]
+                        stored.append((fut, channel_id, {"id": row[0], "sender": sender, "text": text, "createdAt": row[1]}))
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+        except Exception as ex:
+            print("message batch failed:", ex)
+            for *_, fut in pending:
+                if not fut.done():
+                    fut.set_exception(ex)
+            with self._lock:
+                self.failed += len(pending)
+            return
+        for fut, channel_id, message in stored:
+            message_broker.publish(channel_id, message["id"])
+            fut.set_result(message)
+        for fut, message in replays:
+            fut.set_result(message)
+        with self._lock:
+            self.commits += 1
+            self.written += len(stored)
+            self.largest_batch = max(self.largest_batch, len(pending))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "windowMs": self.window * 1000,
+                "queued": self._queue.qsize(),
+                "commits": self.commits,
+                "written": self.written,
+                "failed": self.failed,
+                "avgBatch": round(self.written / self.commits, 2) if self.commits else 0,
+                "largestBatch": self.largest_batch,
+            }
+
+
+message_writer = MessageWriter()
+
+class MessageArchive(SqliteSideFile):
+    """Compressed segments of cold chat history, kept in a file beside the main DB."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS segments ("
+        "channel_id INTEGER NOT NULL, first_id INTEGER NOT NULL, last_id INTEGER NOT NULL, data BLOB NOT NULL, "
+        "PRIMARY KEY (channel_id, first_id))",
+    )
+
+    def __init__(self, path: str = ARCHIVE_DB_PATH, cache_size: int = ARCHIVE_CACHE_SIZE):
+        super().__init__(path)
+        self.cache = TtlLruCache(cache_size, 3600)
+        self.loads = 0
+
+    def put(self, channel_id: int, rows: List[tuple]) -> None:
+        """Store ``(id, sender, text, created_at)`` rows, ordered by id, as one segment."""
+        data = zlib.compress(json.dumps(rows, separators=(",", ":")).encode("utf-8"), 6)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO segments (channel_id, first_id, last_id, data) VALUES (?, ?, ?, ?)",
+                (channel_id, rows[0][0], rows[-1][0], data),
+            )
+
+    def load(self, channel_id: int, first_id: int) -> List[dict]:
+        def read() -> List[dict]:
+            with self._conn() as conn:
+                row = conn.execute(
+                    "SELECT data FROM segments WHERE channel_id = ? AND first_id = ?", (channel_id, first_id)
+                ).fetchone()
+            if row is None:
+                raise LookupError(f"archive segment {channel_id}/{first_id} is missing")
+            self.loads += 1
+            return [
+                {"id": r[0], "sender": r[1], "text": r[2], "createdAt": r[3]}
+                for r in json.loads(zlib.decompress(row[0]))
+            ]
+
+        return self.cache.get_or_load((channel_id, first_id), read)
+
+    def stats(self) -> dict:
+        with self._conn() as conn:
+            segments, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM segments").fetchone()
+        return {"path": self.path, "segments": segments, "bytes": size, "loads": self.loads, "cache": self.cache.stats()}
+
+
+message_archive = MessageArchive()
+
+class MessageArchiver:
+    """Moves chat messages older than ``days`` from ``messages`` into archive segments."""
+
+    LEASE = "message-archive"
+
+    def __init__(self, days: float = MESSAGE_ARCHIVE_DAYS, interval: float = MESSAGE_ARCHIVE_INTERVAL,
+                 segment_size: int = MESSAGE_SEGMENT_SIZE):
+        self.days = days
+        self.interval = interval
+        self.segment_size = max(1, segment_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_run: Optional[float] = None
+        self.last_archived = 0
+        self.last_error: Optional[str] = None
+
+    def run_once(self, days: Optional[float] = None) -> int:
+        days = self.days if days is None else days
+        min_rows = max(1, self.segment_size // 10)
+        archived = 0
+        with self._lock, db_connection() as conn:
+            try:
+                # Older rows were archived on earlier runs, so the index range stays small;
+                # without INDEXED BY the planner walks the rowid down from the newest message.
+                cutoff = conn.execute(
+                    "SELECT MAX(id) FROM messages INDEXED BY idx_messages_created_at "
+                    "WHERE created_at < datetime('now', ?)",
+                    (f"-{days} days",),
+                ).fetchone()[0]
+                channels = [] if cutoff is None else conn.execute(
+                    "SELECT channel_id FROM messages WHERE id <= ? GROUP BY channel_id HAVING COUNT(*) >= ?",
+                    (cutoff, min_rows),
+                ).fetchall()
+                conn.commit()
+                for (channel_id,) in channels:
+                    while not self._stop.is_set():
+                        rows = conn.execute(
+                            "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? AND id <= ? "
+                            "ORDER BY id LIMIT ?",
+                            (channel_id, cutoff, self.segment_size),
+                        ).fetchall()
+                        conn.commit()
+                        if len(rows) < min_rows:
+                            break
+                        message_archive.put(channel_id, rows)
+                        conn.execute("BEGIN IMMEDIATE")
+                        try:
+                            conn.execute(
+                                "INSERT INTO message_segments (channel_id, first_id, last_id, count, first_at, last_at) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                (channel_id, rows[0][0], rows[-1][0], len(rows), rows[0][3], rows[-1][3]),
+                            )
+                            conn.execute(
+                                "DELETE FROM messages WHERE channel_id = ? AND id BETWEEN ? AND ?",
+                                (channel_id, rows[0][0], rows[-1][0]),
+                            )
+                            conn.commit()
+                        except Exception:
+                            conn.rollback()
+                            raise
+                        archived += len(rows)
+                        if len(rows) < self.segment_size:
+                            break
+                self.last_error = None
+            except Exception as ex:
+                self.last_error = str(ex)
+                print("message archive failed:", ex)
+            finally:
+                self.last_run = time.time()
+                self.last_archived = archived
+        return archived
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # One worker per host archives; the lease outlives a run so others skip it.
+            if shared_cache.acquire_lease(self.LEASE, self.interval + 60):
+                self.run_once()
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="message-archive", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "days": self.days,
+            "interval": self.interval,
+            "segmentSize": self.segment_size,
+            "lastRun": self.last_run,
+            "lastArchived": self.last_archived,
+            "lastError": self.last_error,
+        }
+
+
+message_archiver = MessageArchiver()
+
+def iso_timestamp(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+class Presence:
+    """Last-seen time and current game per user, kept in memory."""
+
+    def __init__(self, ttl: float = PRESENCE_TTL, interval: float = PRESENCE_FLUSH_INTERVAL,
+                 sweep_interval: float = PRESENCE_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.interval = interval
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        # username -> (last_seen, online, game_id, game_name)
+        self._seen: Dict[str, Tuple[float, bool, Optional[int], Optional[str]]] = {}
+        self._dirty: Set[str] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.heartbeats = 0
+        self.flushed = 0
+        self.last_flush: Optional[float] = None
+        self.last_sweep: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def heartbeat(self, username: str, online: bool = True, game_id: Optional[int] = None,
+                  game_name: Optional[str] = None) -> None:
+        with self._lock:
+            self._seen[username] = (time.time(), online, game_id, game_name)
+            self._dirty.add(username)
+            self.heartbeats += 1
+
+    def lookup(self, conn: sqlite3.Connection, usernames: List[str]) -> Dict[str, dict]:
+        """Presence for each known username; unknown users are left out."""
+        entries: Dict[str, Tuple[float, bool, Optional[int], Optional[str]]] = {}
+        for i in range(0, len(usernames), 500):
+            chunk = usernames[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            for r in conn.execute(
+                f"SELECT username, last_seen, online, game_id, game_name FROM presence WHERE username IN ({marks})", chunk
+            ):
+                entries[r[0]] = (r[1], bool(r[2]), r[3], r[4])
+        with self._lock:
+            for username in usernames:
+                local = self._seen.get(username)
+                if local is not None and (username not in entries or local[0] >= entries[username][0]):
+                    entries[username] = local
+        now = time.time()
+        out = {}
+        for username, (last_seen, online, game_id, game_name) in entries.items():
+            online = online and now - last_seen < self.ttl
+            out[username] = {
+                "username": username,
+                "online": online,
+                "lastSeen": iso_timestamp(last_seen),
+                "game": {"id": game_id, "name": game_name} if online and game_id is not None else None,
+            }
+        return out
+
+    def flush(self, sweep: bool = False) -> int:
+        with self._lock:
+            batch = {u: self._seen[u] for u in self._dirty}
+            self._dirty.clear()
+        rows = [(u, e[0], int(e[1]), e[2], e[3]) for u, e in batch.items()]
+        cutoff = time.time() - self.ttl
+        try:
+            # Nothing dirty and no sweep due: don't touch the database at all.
+            if rows or sweep:
+                with db_connection() as conn:
+                    if sweep:
+                        self.last_sweep = time.time()
+                        # A plain read on the partial index; only take the write lock if a session ended.
+                        sweep = bool(conn.execute(
+                            "SELECT 1 FROM presence WHERE online = 1 AND last_seen < ? LIMIT 1", (cutoff,)
+                        ).fetchall())
+                    if rows or sweep:
+                        self._write(conn, rows, cutoff, sweep)
+        except Exception as ex:
+            # Keep the batch for the next flush unless a newer heartbeat replaced it.
+            with self._lock:
+                self._dirty.update(batch)
+            self.last_error = str(ex)
+            print("presence flush failed:", ex)
+            return 0
+        now = time.time()
+        with self._lock:
+            # Flushed entries that have gone quiet are served from the table from now on.
+            for username, entry in list(self._seen.items()):
+                if username not in self._dirty and now - entry[0] > self.ttl:
+                    del self._seen[username]
+            self.flushed += len(rows)
+        self.last_flush = now
+        self.last_error = None
+        return len(rows)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple], cutoff: float, sweep: bool) -> None:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            """
+            INSERT INTO presence (username, last_seen, online, game_id, game_name)
+            SELECT ?1, ?2, ?3, ?4, ?5 WHERE EXISTS (SELECT 1 FROM profiles WHERE username = ?1)
+            ON CONFLICT(username) DO UPDATE SET last_seen = excluded.last_seen, online = excluded.online,
+                game_id = excluded.game_id, game_name = excluded.game_name
+            WHERE excluded.last_seen >= presence.last_seen
+            """,
+            rows,
+        )
+        # Sessions end here once per user, whichever worker sweeps first.
+        ended = conn.execute(
+            "UPDATE presence SET online = 0 WHERE online = 1 AND last_seen < ? RETURNING username, last_seen",
+            (cutoff,),
+        ).fetchall() if sweep else []
+        ended += [(r[0], r[1]) for r in rows if not r[2]]
+        conn.executemany(
+            "UPDATE profiles SET last_online = ?1 WHERE username = ?2 AND last_online IS NOT ?1",
+            [(iso_timestamp(last_seen), username) for username, last_seen in ended],
+        )
+        conn.commit()
+
+    def _loop(self) -> None:
+        next_sweep = 0.0
+        while not self._stop.wait(self.interval):
+            sweep = time.monotonic() >= next_sweep
+            if sweep:
+                next_sweep = time.monotonic() + self.sweep_interval
+            self.flush(sweep)
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="presence-flush", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "tracked": len(self._seen),
+                "pending": len(self._dirty),
+                "heartbeats": self.heartbeats,
+                "flushed": self.flushed,
+                "interval": self.interval,
+                "sweepInterval": self.sweep_interval,
+                "lastFlush": self.last_flush,
+                "lastSweep": self.last_sweep,
+                "lastError": self.last_error,
+            }
+
+
+presence = Presence()
+
+class JobQueue:
+    """Small in-process job queue with a fixed pool of worker threads."""
+
+    def __init__(self, workers: int = JOB_WORKERS, history: int = JOB_HISTORY):
+        self.workers = max(1, workers)
+        self.history = max(1, history)
+        self._queue: "queue.Queue[Tuple[str, Callable[[], Any]]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._by_key: Dict[str, str] = {}
+        self._threads: List[threading.Thread] = []
+        self._seq = 0
+
+    def _ensure_workers(self) -> None:
+        if self._threads:
+            return
+        for n in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, kind: str, key: str, fn: Callable[[], Any]) -> dict:
+        with self._lock:
+            existing = self._by_key.get(key)
+            if existing and self._jobs.get(existing, {}).get("status") in ("queued", "running"):
+                return dict(self._jobs[existing])
+            self._seq += 1
+            job_id = f"{kind}-{self._seq}"
+            job = {
+                "id": job_id,
+                "kind": kind,
+                "key": key,
+                "status": "queued",
+                "error": None,
+                "createdAt": time.time(),
+                "finishedAt": None,
+            }
+            self._jobs[job_id] = job
+            self._by_key[key] = job_id
+            while len(self._jobs) > self.history:
+                old_id, old = self._jobs.popitem(last=False)
+                if self._by_key.get(old["key"]) == old_id:
+                    del self._by_key[old["key"]]
+            self._ensure_workers()
+        self._queue.put((job_id, fn))
+        return dict(job)
+
+    def _set(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _run(self) -> None:
+        while True:
+            job_id, fn = self._queue.get()
+            self._set(job_id, status="running")
+            try:
+                fn()
+                self._set(job_id, status="done", finishedAt=time.time())
+            except Exception as ex:
+                print(f"job {job_id} failed:", ex)
+                self._set(job_id, status="failed", error=str(ex), finishedAt=time.time())
+            finally:
+                self._queue.task_done()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_by_key(self, key: str) -> Optional[dict]:
+        with self._lock:
+            job_id = self._by_key.get(key)
+            return dict(self._jobs[job_id]) if job_id in self._jobs else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"workers": self.workers, "depth": self._queue.qsize(), "jobs": counts}
+
+
+jobs = JobQueue()
+
+# Proxy variant -> (IGDB size preset, width to downscale to or None for the original).
+IMAGE_VARIANTS = {
+    "cover": ("t_cover_big", None),
+    # Store and library cards render up to 260px wide; this is their srcset 2x source.
+    "cover2x": ("t_cover_big_2x", None),
+    "thumb": ("t_cover_big", 96),
+    "screenshot": ("t_screenshot_big", None),
+}
+IMAGE_ID_CHARS = frozenset("abcdefghijklmnopqrstuvwxyz0123456789")
+
+def image_url(variant: str, image_id: str) -> str:
+    """Browser URL for an IGDB image, through the local proxy unless it is disabled."""
+    if IMAGE_PROXY_PREFIX:
+        return f"{IMAGE_PROXY_PREFIX}/{variant}/{image_id}.jpg"
+    return f"{IMAGE_BASE_URL}/{IMAGE_VARIANTS[variant][0]}/{image_id}.jpg"
+
+class ImageCache(SqliteSideFile):
+    """Content-addressed disk cache for proxied images with size-based LRU eviction."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS blobs (sha TEXT PRIMARY KEY, size INTEGER NOT NULL, content_type TEXT NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS images (key TEXT PRIMARY KEY, sha TEXT NOT NULL, accessed_at REAL NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_images_accessed ON images (accessed_at)",
+        "CREATE INDEX IF NOT EXISTS idx_images_sha ON images (sha)",
+    )
+    # Refresh a key's access time at most this often, so hits rarely write.
+    TOUCH_INTERVAL = 300.0
+
+    def __init__(self, root: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        # Absolute, since send_file resolves relative paths against the app root.
+        self.root = os.path.abspath(root)
+        super().__init__(os.path.join(self.root, "index.db"))
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def _open(self) -> sqlite3.Connection:
+        os.makedirs(self.root, exist_ok=True)
+        return super()._open()
+
+    def blob_path(self, sha: str) -> str:
+        return os.path.join(self.root, sha[:2], sha)
+
+    def get(self, key: str) -> Optional[Tuple[str, str, str]]:
+        """``(path, content_type, sha)`` for a cached key whose blob exists, else None."""
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT i.sha, b.content_type, i.accessed_at FROM images i JOIN blobs b ON b.sha = i.sha WHERE i.key = ?",
+                (key,),
+            ).fetchone()
+            if row is not None and now - row[2] > self.TOUCH_INTERVAL:
+                conn.execute("UPDATE images SET accessed_at = ? WHERE key = ?", (now, key))
+        hit = row is not None and os.path.exists(self.blob_path(row[0]))
+        with self._lock:
+            if not hit:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return self.blob_path(row[0]), row[1], row[0]
+
+    def put(self, key: str, data: bytes, content_type: str) -> Tuple[str, str, str]:
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha, size, content_type) VALUES (?, ?, ?)", (sha, len(data), content_type)
+            )
+            conn.execute("INSERT OR REPLACE INTO images (key, sha, accessed_at) VALUES (?, ?, ?)", (key, sha, time.time()))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        with self._lock:
+            self.stored += 1
+        if total > self.max_bytes:
+            self.evict(total)
+        return path, content_type, sha
+
+    def evict(self, total: int) -> None:
+        target = int(self.max_bytes * 0.9)
+        with self._conn() as conn:
+            while total > target:
+                keys, freeing = [], 0
+                for key, size in conn.execute(
+                    "SELECT i.key, b.size FROM images i JOIN blobs b ON b.sha = i.sha ORDER BY i.accessed_at LIMIT 500"
+                ):
+                    keys.append(key)
+                    freeing += size
+                    if total - freeing <= target:
+                        break
+                if not keys:
+                    break
+                marks = ",".join("?" * len(keys))
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    shas = {r[0] for r in conn.execute(f"SELECT sha FROM images WHERE key IN ({marks})", keys)}
+                    conn.execute(f"DELETE FROM images WHERE key IN ({marks})", keys)
+                    orphans = []
+                    for sha in shas:
+                        if conn.execute("SELECT 1 FROM images WHERE sha = ? LIMIT 1", (sha,)).fetchone() is None:
+                            size = conn.execute("SELECT size FROM blobs WHERE sha = ?", (sha,)).fetchone()
+                            conn.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+                            orphans.append((sha, size[0] if size else 0))
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                for sha, size in orphans:
+                    try:
+                        os.remove(self.blob_path(sha))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                with self._lock:
+                    self.evicted += len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stored": self.stored,
+                "evicted": self.evicted,
+                "resizing": Image is not None,
+            }
+
+
+image_cache = ImageCache()
+image_flights = SingleFlight()
+image_session = None
+if requests is not None:
+    image_session = requests.Session()
+    image_session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=IGDB_POOL_SIZE))
+    image_session.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=IGDB_POOL_SIZE))
+
+def _resize_jpeg(data: bytes, width: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as im:
+        if im.width > width:
+            im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        im.convert("RGB").save(out, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+    resized = out.getvalue()
+    return resized if len(resized) < len(data) else data
+
+def _fetch_image(variant: str, image_id: str) -> Tuple[str, str, str]:
+    """Cache entry for ``variant`` of ``image_id``, downloading or resizing it on a miss."""
+    key = f"{variant}/{image_id}"
+    hit = image_cache.get(key)
+    if hit is not None:
+        return hit
+    preset, width = IMAGE_VARIANTS[variant]
+    if width:
+        source = next(name for name, spec in IMAGE_VARIANTS.items() if spec == (preset, None))
+        path, content_type, _ = image_flights.do(f"{source}/{image_id}", lambda: _fetch_image(source, image_id))
+        with open(path, "rb") as f:
+            data = f.read()
+        if Image is not None:
+            try:
+                data = _resize_jpeg(data, width)
+            except Exception as ex:
+                print("image resize failed for", key, "->", ex)
+    else:
+        if image_session is None:
+            raise RuntimeError("requests not installed")
+        resp = image_session.get(
+            f"{IMAGE_BASE_URL}/{preset}/{image_id}.jpg", timeout=(IGDB_CONNECT_TIMEOUT, IMAGE_FETCH_TIMEOUT), stream=True
+        )
+        try:
+            resp.raise_for_status()
+            content_type = resp.headers.get("Content-Type") or "image/jpeg"
+            if not content_type.startswith("image/"):
+                raise ValueError(f"unexpected content type {content_type}")
+            data = resp.raw.read(IMAGE_MAX_BYTES + 1, decode_content=True)
+        finally:
+            resp.close()
+        if len(data) > IMAGE_MAX_BYTES:
+            raise ValueError("image too large")
+    return image_cache.put(key, data, content_type)
 
 def game_price(game_id: int) -> float:
     try:
@@ -93,140 +1923,112 @@ def _placeholder_games_pool() -> List[dict]:
         {"id": 1030, "name": "Zephyr Edge"},
     ]
 
+SEED_POOL_SIZE = 200
+
+def _fetch_seed_pool() -> List[dict]:
+    q = (
+        "fields id,name,cover.image_id,total_rating_count; "
+        "where cover != null & version_parent = null; "
+        f"sort total_rating_count desc; limit {SEED_POOL_SIZE}; offset 0;"
+    )
+    picks = []
+    for g in igdb.query(q, name="seed"):
+        gid = g.get("id")
+        nm = g.get("name")
+        if gid and nm:
+            picks.append({"id": int(gid), "name": nm})
+    return picks
+
+def popular_games_pool() -> List[dict]:
+    """Popular games every new library is drawn from, shared by all users."""
+    try:
+        with db_connection() as conn:
+            if catalog_ready(conn):
+                rows = conn.execute(
+                    "SELECT id, name FROM games WHERE cover_image_id IS NOT NULL AND version_parent IS NULL "
+                    "ORDER BY total_rating_count DESC, id ASC LIMIT ?",
+                    (SEED_POOL_SIZE,),
+                ).fetchall()
+                if rows:
+                    return [{"id": r[0], "name": r[1]} for r in rows]
+    except Exception as ex:
+        print("local seed pool read failed:", ex)
+    if igdb.is_configured():
+        try:
+            return catalog_cache.get_or_load(("seed", SEED_POOL_SIZE, 0), _fetch_seed_pool)
+        except Exception as ex:
+            print("IGDB seed pool failed:", ex)
+    return []
+
 def seed_user_library(username: str, want: int = 10) -> None:
     try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute("SELECT COUNT(1) FROM library WHERE owner_username = ?", (username,))
-        count = c.fetchone()[0]
-        if count and int(count) > 0:
-            conn.close()
+        with db_connection() as conn:
+            row = conn.execute("SELECT 1 FROM library WHERE owner_username = ? LIMIT 1", (username,)).fetchone()
+        if row:
             return
-        conn.close()
     except Exception:
         return
-    picks: List[dict] = []
-    client_id = os.getenv("IGDB_CLIENT_ID")
-    access_token = ensure_igdb_token()
-    if client_id and access_token and requests is not None:
-        big_limit = 200
-        q = (
-            "fields id,name,cover.image_id,total_rating_count; "
-            "where cover != null & version_parent = null; "
-            f"sort total_rating_count desc; limit {big_limit}; offset 0;"
-        )
-        try:
-            resp = requests.post(
-                "https://api.igdb.com/v4/games",
-                data=q,
-                headers={
-                    "Client-ID": client_id,
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                    "Content-Type": "text/plain",
-                },
-                timeout=12,
-            )
-            if resp.ok:
-                arr = resp.json()
-                for g in arr:
-                    gid = g.get("id")
-                    nm = g.get("name")
-                    if gid and nm:
-                        picks.append({"id": int(gid), "name": nm})
-        except Exception:
-            picks = []
-    if not picks:
-        picks = _placeholder_games_pool()
+    picks = popular_games_pool() or _placeholder_games_pool()
     h = _username_hash(username)
     start = h % max(1, len(picks))
     selected = []
     for i in range(min(want, len(picks))):
         it = picks[(start + i) % len(picks)]
         selected.append({"id": it["id"], "name": it["name"]})
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        for g in selected:
-            c.execute(
-                "INSERT INTO library (owner_username, game_id, game_name) VALUES (?, ?, ?)",
-                (username, str(g["id"]), g["name"]),
-            )
+    with db_connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO library (owner_username, game_id, game_name) VALUES (?, ?, ?)",
+            [(username, str(g["id"]), g["name"]) for g in selected],
+        )
         conn.commit()
-        conn.close()
-    except Exception:
-        pass
+    owned_games_cache.invalidate(username)
 
-@app.route("/store/games", methods=["GET"])
-def store_games():
-    sort = (request.args.get("sort") or "popularity").lower()
-    limit = 200
-    try:
-        offset = max(0, int(request.args.get("offset", 0)))
-    except Exception:
-        offset = 0
-    client_id = os.getenv("IGDB_CLIENT_ID")
-    access_token = ensure_igdb_token()
-    if not (client_id and access_token and requests is not None):
-        print("[store_games] IGDB not configured (client_id/access_token/requests). Returning empty list.")
-        return jsonify([])
+def enqueue_library_seed(username: str) -> dict:
+    return jobs.submit("seed", f"seed:{username}", lambda: seed_user_library(username))
+
+def _owned_set(game_ids: Iterable[Any]) -> FrozenSet[int]:
+    return frozenset(int(gid) for gid in game_ids if str(gid).isdigit())
+
+def owned_game_ids(username: str) -> FrozenSet[int]:
+    """Numeric game ids in ``username``'s library, cached per user."""
+    with db_connection() as conn:
+        # Read the version before the rows: a racing write then only costs a reload.
+        version = data_versions(conn, [f"library:{username}"])[0]
+        cached = owned_games_cache.get(username)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        rows = conn.execute("SELECT game_id FROM library WHERE owner_username = ?", (username,)).fetchall()
+    owned = _owned_set(r[0] for r in rows)
+    owned_games_cache.put(username, (version, owned))
+    return owned
+
+def _mark_installed(items: List[dict], username: Optional[str]) -> List[dict]:
+    installed_ids: FrozenSet[int] = frozenset()
+    if username:
+        try:
+            installed_ids = owned_game_ids(username)
+        except Exception:
+            installed_ids = frozenset()
+    if installed_ids:
+        for it in items:
+            it["installed"] = it["id"] in installed_ids
+    else:
+        for i, it in enumerate(items):
+            it["installed"] = i < 3
+    return items
+
+def _fetch_store_items(limit: int, offset: int) -> List[dict]:
     q = (
         "fields id,name,cover.image_id,total_rating,total_rating_count; "
         "where cover != null & version_parent = null; "
         f"sort total_rating_count desc; limit {limit}; offset {offset};"
     )
-    try:
-        resp = requests.post(
-            "https://api.igdb.com/v4/games",
-            data=q,
-            headers={
-                "Client-ID": client_id,
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/json",
-                "Content-Type": "text/plain",
-            },
-            timeout=12,
-        )
-        if resp.status_code in (401, 403):
-            os.environ.pop("IGDB_ACCESS_TOKEN", None)
-            access_token2 = ensure_igdb_token()
-            if access_token2:
-                resp = requests.post(
-                    "https://api.igdb.com/v4/games",
-                    data=q,
-                    headers={
-                        "Client-ID": client_id,
-                        "Authorization": f"Bearer {access_token2}",
-                        "Accept": "application/json",
-                        "Content-Type": "text/plain",
-                    },
-                    timeout=12,
-                )
-        if not resp.ok:
-            print("IGDB store games HTTP", resp.status_code, "->", resp.text[:300])
-            if resp.status_code == 400:
-                q_fallback = (
-                    "fields id,name,cover.image_id,total_rating,total_rating_count; "
-                    "where cover != null; "
-                    f"sort total_rating_count desc; limit {limit}; offset {offset};"
-                )
-                resp = requests.post(
-                    "https://api.igdb.com/v4/games",
-                    data=q_fallback,
-                    headers={
-                        "Client-ID": client_id,
-                        "Authorization": f"Bearer {access_token}",
-                        "Accept": "application/json",
-                        "Content-Type": "text/plain",
-                    },
-                    timeout=12,
-                )
-            if not resp.ok:
-                resp.raise_for_status()
-        arr = resp.json()
-    except Exception as ex:
-        print("IGDB store games failed:", ex)
-        return jsonify([])
+    q_fallback = (
+        "fields id,name,cover.image_id,total_rating,total_rating_count; "
+        "where cover != null; "
+        f"sort total_rating_count desc; limit {limit}; offset {offset};"
+    )
+    arr = igdb.query(q, name="store", fallback=q_fallback)
     items = []
     for g in arr:
         cover = (g.get("cover") or {}).get("image_id")
@@ -237,12 +2039,56 @@ def store_games():
             {
                 "id": gid,
                 "name": g.get("name") or f"Game {gid}",
-                "coverUrl": f"https://images.igdb.com/igdb/image/upload/t_cover_big/{cover}.jpg",
+                "coverUrl": image_url("cover", cover),
+                "coverUrl2x": image_url("cover2x", cover),
                 "rating": float(g.get("total_rating") or 0.0),
                 "popularity": float(g.get("total_rating_count") or 0.0),
                 "price": game_price(gid),
             }
         )
+    return items
+
+def _store_scopes() -> Optional[List[str]]:
+    # Upstream-cache fallback pages aren't versioned; only the synced catalog is.
+    if not catalog_ready(get_db()):
+        return None
+    username = request.args.get("username")
+    return ["games", f"library:{username}"] if username else ["games"]
+
+@app.route("/store/games", methods=["GET"])
+@conditional(_store_scopes)
+def store_games():
+    sort = (request.args.get("sort") or "popularity").lower()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 200)), 200))
+    except Exception:
+        limit = 200
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+    except Exception:
+        offset = 0
+    items = None
+    try:
+        conn = get_db()
+        if catalog_ready(conn):
+            items = catalog_page(conn, sort, limit, offset)
+    except Exception as ex:
+        print("local catalog read failed:", ex)
+    if items is None:
+        # Local catalog not synced yet: fall back to a cached upstream page.
+        items = _remote_store(sort, limit, offset)
+    return jsonify(_mark_installed(items, request.args.get("username")))
+
+def _remote_store(sort: str, limit: int, offset: int) -> List[dict]:
+    if not igdb.is_configured():
+        print("[store_games] IGDB not configured (client_id/access_token/requests). Returning empty list.")
+        return []
+    try:
+        cached = catalog_cache.get_or_load(("store", limit, offset), lambda: _fetch_store_items(limit, offset))
+    except Exception as ex:
+        print("IGDB store games failed:", ex)
+        return []
+    items = [dict(it) for it in cached]
     if sort == "price_asc":
         items.sort(key=lambda x: x["price"]) 
     elif sort == "price_desc":
@@ -251,32 +2097,10 @@ def store_games():
         items.sort(key=lambda x: (x["rating"]), reverse=True)
     else:
         items.sort(key=lambda x: (x["popularity"]), reverse=True)
-    username = request.args.get("username")
-    installed_ids: Set[int] = set()
-    if username:
-        try:
-            conn = sqlite3.connect(DB_NAME)
-            c = conn.cursor()
-            c.execute("SELECT game_id FROM library WHERE owner_username = ?", (username,))
-            installed_ids = {int(r[0]) for r in c.fetchall() if str(r[0]).isdigit()}
-            conn.close()
-        except Exception:
-            installed_ids = set()
-    if installed_ids:
-        for it in items:
-            try:
-                it["installed"] = int(it["id"]) in installed_ids
-            except Exception:
-                it["installed"] = False
-    else:
-        for i, it in enumerate(items):
-            it["installed"] = i < 3
-    return jsonify(items)
+    return items
 
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+def _migration_1_baseline(c: sqlite3.Cursor) -> None:
     c.execute("""
         CREATE TABLE IF NOT EXISTS profiles (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -347,18 +2171,568 @@ def init_db():
             text TEXT NOT NULL,
             created_at TEXT DEFAULT (datetime('now'))
         )
-        """
-    )
-    conn.commit()
-    conn.close()
+        """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            cover_image_id TEXT,
+            total_rating REAL NOT NULL DEFAULT 0,
+            total_rating_count REAL NOT NULL DEFAULT 0,
+            price REAL NOT NULL,
+            version_parent INTEGER,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_price ON games (price)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_total_rating ON games (total_rating)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_total_rating_count ON games (total_rating_count)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_updated_at ON games (updated_at)")
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sync_state (
+            name TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """
+    )
+
+def _migration_2_hot_table_indexes(c: sqlite3.Cursor) -> None:
+    # Drop duplicate rows left behind before friends/library had UNIQUE constraints.
+    c.execute(
+        "DELETE FROM friends WHERE id NOT IN "
+        "(SELECT MIN(id) FROM friends GROUP BY owner_username, friend_username)"
+    )
+    c.execute(
+        "DELETE FROM library WHERE id NOT IN "
+        "(SELECT MIN(id) FROM library GROUP BY owner_username, game_id)"
+    )
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_friends_owner_friend ON friends (owner_username, friend_username)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_library_owner_game ON library (owner_username, game_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_friend_requests_pair ON friend_requests (from_username, to_username)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_friend_requests_to_status ON friend_requests (to_username, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_friend_requests_from_status ON friend_requests (from_username, status)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages (channel_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_channel_members_username ON channel_members (username, channel_id)")
+
+def _migration_3_dm_key(c: sqlite3.Cursor) -> None:
+    c.execute("ALTER TABLE channels ADD COLUMN dm_key TEXT")
+    # Racing clients could create the same DM twice; fold duplicates into the oldest channel.
+    dupes = c.execute(
+        "SELECT name, MIN(id) FROM channels WHERE name LIKE 'dm:%' GROUP BY name HAVING COUNT(*) > 1"
+    ).fetchall()
+    for name, keep in dupes:
+        others = [r[0] for r in c.execute("SELECT id FROM channels WHERE name = ? AND id != ?", (name, keep))]
+        for other in others:
+            c.execute("UPDATE messages SET channel_id = ? WHERE channel_id = ?", (keep, other))
+            c.execute(
+                "INSERT OR IGNORE INTO channel_members (channel_id, username) "
+                "SELECT ?, username FROM channel_members WHERE channel_id = ?",
+                (keep, other),
+            )
+            c.execute("DELETE FROM channel_members WHERE channel_id = ?", (other,))
+            c.execute("DELETE FROM channels WHERE id = ?", (other,))
+    c.execute("UPDATE channels SET dm_key = name WHERE name LIKE 'dm:%'")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_channels_dm_key ON channels (dm_key) WHERE dm_key IS NOT NULL")
+
+def _version_triggers(c: sqlite3.Cursor, table: str, *scopes: Callable[[str], str]) -> None:
+    for event, rows in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+        bumps = "".join(
+            f"INSERT INTO data_versions (name, version) VALUES ({scope(row)}, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1; "
+            for row in rows
+            for scope in scopes
+        )
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()} AFTER {event} ON {table} BEGIN {bumps}END")
+
+def _migration_4_data_versions(c: sqlite3.Cursor) -> None:
+    # Change counters bumped by triggers, so every writer (any worker, jobs, scripts)
+    # invalidates response ETags. The random epoch keeps ETags from a recreated
+    # database from colliding with old ones.
+    c.execute("CREATE TABLE IF NOT EXISTS data_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)")
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('epoch', abs(random()))")
+    _version_triggers(c, "profiles", lambda row: "'profiles'")
+    _version_triggers(c, "games", lambda row: "'games'")
+    _version_triggers(c, "friends", lambda row: f"'friends:' || {row}.owner_username")
+    _version_triggers(c, "library", lambda row: f"'library:' || {row}.owner_username")
+
+MESSAGE_FTS_DONE = "messages_fts_done"
+MESSAGE_FTS_UNTIL = "messages_fts_until"
+# Segments archived before migration 12 lost their index entries; backfill re-adds them up to here.
+MESSAGE_FTS_SEGMENTS_DONE = "messages_fts_segments_done"
+MESSAGE_FTS_SEGMENTS_UNTIL = "messages_fts_segments_until"
+# Rows up to MESSAGE_FTS_UNTIL predate the index and are added by backfill_message_search();
+# ids in (done, until] aren't indexed yet, so deletes and updates must skip them.
+_FTS_INDEXED = (
+    f"old.id > (SELECT CAST(value AS INTEGER) FROM sync_state WHERE name = '{MESSAGE_FTS_UNTIL}') "
+    f"OR old.id <= (SELECT CAST(value AS INTEGER) FROM sync_state WHERE name = '{MESSAGE_FTS_DONE}')"
+)
+_FTS_REMOVE = (
+    "INSERT INTO messages_fts (messages_fts, rowid, text, chan) "
+    "VALUES ('delete', old.id, old.text, 'c' || old.channel_id);"
+)
+
+def _migration_5_message_search(c: sqlite3.Cursor) -> None:
+    # External-content index over a view that adds a "c<channel_id>" token, so a
+    # search can be restricted to a user's channels inside the index itself.
+    c.execute("CREATE VIEW IF NOT EXISTS messages_fts_source AS SELECT id, text, 'c' || channel_id AS chan FROM messages")
+    c.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "text, chan, content='messages_fts_source', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    until = c.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+    c.executemany(
+        "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+        [(MESSAGE_FTS_UNTIL, str(until)), (MESSAGE_FTS_DONE, "0")],
+    )
+    indexed, remove = _FTS_INDEXED, _FTS_REMOVE
+    c.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_messages_fts_insert AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts (rowid, text, chan) VALUES (new.id, new.text, 'c' || new.channel_id); END"
+    )
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_messages_fts_delete AFTER DELETE ON messages WHEN {indexed} BEGIN {remove} END")
+    c.execute(
+        f"CREATE TRIGGER IF NOT EXISTS trg_messages_fts_update AFTER UPDATE OF text, channel_id ON messages WHEN {indexed} BEGIN "
+        f"{remove} INSERT INTO messages_fts (rowid, text, chan) VALUES (new.id, new.text, 'c' || new.channel_id); END"
+    )
+
+def _migration_6_profile_search(c: sqlite3.Cursor) -> None:
+    # Short prefixes use the lower() expression indexes; three or more characters
+    # can also match anywhere in username or name through the trigram index.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_profiles_username_lower ON profiles (lower(username))")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_profiles_name_lower ON profiles (lower(name))")
+    c.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS profiles_fts USING fts5("
+        "username, name, content='profiles', content_rowid='id', tokenize='trigram')"
+    )
+    c.execute("INSERT INTO profiles_fts (profiles_fts) VALUES ('rebuild')")
+    remove = "INSERT INTO profiles_fts (profiles_fts, rowid, username, name) VALUES ('delete', old.id, old.username, old.name);"
+    add = "INSERT INTO profiles_fts (rowid, username, name) VALUES (new.id, new.username, new.name);"
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_profiles_fts_insert AFTER INSERT ON profiles BEGIN {add} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_profiles_fts_delete AFTER DELETE ON profiles BEGIN {remove} END")
+    c.execute(f"CREATE TRIGGER IF NOT EXISTS trg_profiles_fts_update AFTER UPDATE OF username, name ON profiles BEGIN {remove} {add} END")
+
+def _migration_7_social_versions(c: sqlite3.Cursor) -> None:
+    _version_triggers(
+        c,
+        "friend_requests",
+        lambda row: f"'requests:' || {row}.from_username",
+        lambda row: f"'requests:' || {row}.to_username",
+    )
+    _version_triggers(c, "channel_members", lambda row: f"'channels:' || {row}.username")
+
+def _migration_8_presence(c: sqlite3.Cursor) -> None:
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS presence (
+            username TEXT PRIMARY KEY,
+            last_seen REAL NOT NULL,
+            online INTEGER NOT NULL DEFAULT 1,
+            game_id INTEGER,
+            game_name TEXT
+        )
+        """
+    )
+
+def _migration_9_message_segments(c: sqlite3.Cursor) -> None:
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_segments (
+            channel_id INTEGER NOT NULL,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            first_at TEXT,
+            last_at TEXT,
+            archived_at TEXT DEFAULT (datetime('now')),
+            PRIMARY KEY (channel_id, first_id)
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_message_segments_last ON message_segments (channel_id, last_id)")
+
+def _migration_10_presence_sweep(c: sqlite3.Cursor) -> None:
+    c.execute("CREATE INDEX IF NOT EXISTS idx_presence_online_seen ON presence (last_seen) WHERE online = 1")
+
+def _migration_12_archive_search(c: sqlite3.Cursor) -> None:
+    # Archiving deletes hot rows after recording their segment; those rows keep their index
+    # entries and search reads their text from the segment. ('rebuild' would drop them.)
+    c.execute("DROP TRIGGER IF EXISTS trg_messages_fts_delete")
+    c.execute(
+        f"CREATE TRIGGER trg_messages_fts_delete AFTER DELETE ON messages WHEN ({_FTS_INDEXED}) AND NOT EXISTS ("
+        "SELECT 1 FROM message_segments s WHERE s.channel_id = old.channel_id AND s.first_id <= old.id "
+        f"AND s.last_id >= old.id) BEGIN {_FTS_REMOVE} END"
+    )
+    until = c.execute("SELECT COALESCE(MAX(rowid), 0) FROM message_segments").fetchone()[0]
+    c.executemany(
+        "INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+        [(MESSAGE_FTS_SEGMENTS_UNTIL, str(until)), (MESSAGE_FTS_SEGMENTS_DONE, "0")],
+    )
+    # The archiver finds its cutoff by age.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages (created_at)")
+
+def _migration_11_message_client_id(c: sqlite3.Cursor) -> None:
+    # Lets a client retry a send whose response it never saw without posting the message twice.
+    c.execute("ALTER TABLE messages ADD COLUMN client_id TEXT")
+    c.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_messages_client_id ON messages (channel_id, client_id) "
+        "WHERE client_id IS NOT NULL"
+    )
+
+# Append-only: never edit or reorder an applied migration, add a new one instead.
+MIGRATIONS = [
+    (1, "baseline schema", _migration_1_baseline),
+    (2, "hot table indexes and uniqueness", _migration_2_hot_table_indexes),
+    (3, "unique DM channel key", _migration_3_dm_key),
+    (4, "data version counters", _migration_4_data_versions),
+    (5, "message full-text search", _migration_5_message_search),
+    (6, "profile search indexes", _migration_6_profile_search),
+    (7, "friend request and channel versions", _migration_7_social_versions),
+    (8, "presence", _migration_8_presence),
+    (9, "archived message segments", _migration_9_message_segments),
+    (10, "presence session sweep index", _migration_10_presence_sweep),
+    (11, "message client ids", _migration_11_message_client_id),
+    (12, "searchable message archive", _migration_12_archive_search),
+]
+
+def migrate(db_path: str = DB_NAME) -> int:
+    """Apply pending migrations in order and return the resulting schema version."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT DEFAULT (datetime('now'))
+            )
+            """
+        )
+        version = 0
+        for target, name, fn in MIGRATIONS:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()[0]
+                if target <= version:
+                    conn.execute("COMMIT")
+                    continue
+                fn(conn.cursor())
+                conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (target, name))
+                conn.execute("COMMIT")
+                version = target
+                print(f"Applied migration {target}: {name}")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return version
+    finally:
+        conn.close()
+
+def init_db():
+    migrate()
+
+def backfill_message_search(batch: int = 20000, db_path: str = DB_NAME) -> int:
+    """Index messages that predate the search index, one id range per transaction."""
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0)
+    try:
+        state = dict(conn.execute(
+            "SELECT name, CAST(value AS INTEGER) FROM sync_state WHERE name IN (?, ?)", (MESSAGE_FTS_DONE, MESSAGE_FTS_UNTIL)
+        ).fetchall())
+        done, until = state.get(MESSAGE_FTS_DONE, 0), state.get(MESSAGE_FTS_UNTIL, 0)
+        indexed = 0
+        started = time.perf_counter()
+        while done < until:
+            high = min(done + batch, until)
+            cur = conn.execute(
+                "INSERT INTO messages_fts (rowid, text, chan) "
+                "SELECT id, text, 'c' || channel_id FROM messages WHERE id > ? AND id <= ?",
+                (done, high),
+            )
+            conn.execute("UPDATE sync_state SET value = ? WHERE name = ?", (str(high), MESSAGE_FTS_DONE))
+            conn.commit()
+            indexed += max(0, cur.rowcount)
+            done = high
+            print(f"search backfill: {done}/{until} ({indexed} messages, {time.perf_counter() - started:.1f}s)")
+        indexed += backfill_segment_search(conn)
+        if indexed:
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+            conn.commit()
+        return indexed
+    finally:
+        conn.close()
+
+def backfill_segment_search(conn: sqlite3.Connection) -> int:
+    # Segments archived before migration 12, or dropped by an FTS 'rebuild', have no index entries.
+    state = dict(conn.execute(
+        "SELECT name, CAST(value AS INTEGER) FROM sync_state WHERE name IN (?, ?)",
+        (MESSAGE_FTS_SEGMENTS_DONE, MESSAGE_FTS_SEGMENTS_UNTIL),
+    ).fetchall())
+    done, until = state.get(MESSAGE_FTS_SEGMENTS_DONE, 0), state.get(MESSAGE_FTS_SEGMENTS_UNTIL, 0)
+    indexed = 0
+    segments = conn.execute(
+        "SELECT rowid, channel_id, first_id FROM message_segments WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+        (done, until),
+    ).fetchall()
+    for seg, channel_id, first_id in segments:
+        rows = message_archive.load(channel_id, first_id)
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT INTO messages_fts (rowid, text, chan) VALUES (?, ?, ?)",
+            [(r["id"], r["text"], f"c{channel_id}") for r in rows],
+        )
+        conn.execute("UPDATE sync_state SET value = ? WHERE name = ?", (str(seg), MESSAGE_FTS_SEGMENTS_DONE))
+        conn.commit()
+        indexed += len(rows)
+    if segments:
+        print(f"search backfill: {len(segments)} archived segments ({indexed} messages)")
+    return indexed
+
+CATALOG_ORDER_BY = {
+    "price_asc": "price ASC, id ASC",
+    "price_desc": "price DESC, id ASC",
+    "rating": "total_rating DESC, id ASC",
+    "popularity": "total_rating_count DESC, id ASC",
+}
+
+def catalog_ready(conn: sqlite3.Connection) -> bool:
+    # Serve from the local table only after one full sync, so sorts and offsets never see a partial catalog.
+    try:
+        return conn.execute("SELECT 1 FROM sync_state WHERE name = ?", (CatalogSync.DONE_KEY,)).fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+
+def catalog_page(conn: sqlite3.Connection, sort: str, limit: int, offset: int) -> List[dict]:
+    order_by = CATALOG_ORDER_BY.get(sort, CATALOG_ORDER_BY["popularity"])
+    rows = conn.execute(
+        f"""
+        SELECT id, name, cover_image_id, total_rating, total_rating_count, price
+        FROM games
+        WHERE cover_image_id IS NOT NULL AND version_parent IS NULL
+        ORDER BY {order_by}
+        LIMIT ? OFFSET ?
+        """,
+        (limit, offset),
+    ).fetchall()
+    return [
+        {
+            "id": r[0],
+            "name": r[1] or f"Game {r[0]}",
+            "coverUrl": image_url("cover", r[2]),
+            "coverUrl2x": image_url("cover2x", r[2]),
+            "rating": float(r[3] or 0.0),
+            "popularity": float(r[4] or 0.0),
+            "price": float(r[5]),
+        }
+        for r in rows
+    ]
+
+class CatalogSync:
+    """Mirrors the IGDB games catalog into the local ``games`` table."""
+
+    STATE_KEY = "games_updated_at"
+    DONE_KEY = "games_synced_at"
+    LEASE = "catalog-sync"
+
+    def __init__(self, interval: float = CATALOG_SYNC_INTERVAL, page_size: int = CATALOG_SYNC_PAGE_SIZE):
+        self.interval = interval
+        self.page_size = page_size
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.last_upserted = 0
+        self.leader = False
+
+    def _watermark(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        # Stored as "updated_at:id" of the last game synced; older values hold only updated_at.
+        row = conn.execute("SELECT value FROM sync_state WHERE name = ?", (self.STATE_KEY,)).fetchone()
+        try:
+            parts = [int(x) for x in str(row[0]).split(":")] if row else [0]
+            return parts[0], parts[1] if len(parts) > 1 else 0
+        except Exception:
+            return 0, 0
+
+    def run_once(self) -> int:
+        if not igdb.is_configured():
+            return 0
+        with self._lock, db_connection() as conn:
+            upserted = 0
+            try:
+                since, since_id = self._watermark(conn)
+                high = (since, since_id)
+                offset = 0
+                complete = False
+                while not self._stop.is_set():
+                    # Strictly after the watermark, ties broken by id, so an idle run writes nothing.
+                    # Games without a cover are synced too, so a removed cover clears cover_image_id.
+                    q = (
+                        "fields id,name,cover.image_id,total_rating,total_rating_count,version_parent,updated_at; "
+                        f"where updated_at > {since} | (updated_at = {since} & id > {since_id}); "
+                        f"sort updated_at asc; limit {self.page_size}; offset {offset};"
+                    )
+                    arr = igdb.query(q, name="sync")
+                    rows = []
+                    for g in arr:
+                        gid = g.get("id")
+                        if not gid:
+                            continue
+                        gid = int(gid)
+                        updated_at = int(g.get("updated_at") or 0)
+                        high = max(high, (updated_at, gid))
+                        rows.append((
+                            gid,
+                            g.get("name") or f"Game {gid}",
+                            (g.get("cover") or {}).get("image_id"),
+                            float(g.get("total_rating") or 0.0),
+                            float(g.get("total_rating_count") or 0.0),
+                            game_price(gid),
+                            g.get("version_parent"),
+                            updated_at,
+                        ))
+                    if rows:
+                        conn.executemany(
+                            """
+                            INSERT INTO games (id, name, cover_image_id, total_rating, total_rating_count, price, version_parent, updated_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                            ON CONFLICT(id) DO UPDATE SET
+                                name = excluded.name,
+                                cover_image_id = excluded.cover_image_id,
+                                total_rating = excluded.total_rating,
+                                total_rating_count = excluded.total_rating_count,
+                                price = excluded.price,
+                                version_parent = excluded.version_parent,
+                                updated_at = excluded.updated_at
+                            """,
+                            rows,
+                        )
+                        conn.execute(
+                            "INSERT INTO sync_state (name, value) VALUES (?, ?) "
+                            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+                            (self.STATE_KEY, f"{high[0]}:{high[1]}"),
+                        )
+                        conn.commit()
+                        upserted += len(rows)
+                    if len(arr) < self.page_size:
+                        complete = True
+                        break
+                    offset += self.page_size
+                if complete:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO sync_state (name, value) VALUES (?, ?)", (self.DONE_KEY, str(int(time.time())))
+                    )
+                    conn.commit()
+                self.last_error = None
+            except Exception as ex:
+                self.last_error = str(ex)
+                print("catalog sync failed:", ex)
+            finally:
+                self.last_run = time.time()
+                self.last_upserted = upserted
+            return upserted
+
+    def _loop(self) -> None:
+        # With several worker processes only the holder of the host-wide lease syncs;
+        # the others retry periodically so one takes over if the leader dies.
+        while not self._stop.is_set():
+            self.leader = shared_cache.acquire_lease(self.LEASE, self.interval + 60)
+            if self.leader:
+                self.run_once()
+            self._stop.wait(self.interval if self.leader else min(self.interval, 60.0))
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="catalog-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self._thread and self._thread.is_alive()),
+            "leader": self.leader,
+            "interval": self.interval,
+            "lastRun": self.last_run,
+            "lastUpserted": self.last_upserted,
+            "lastError": self.last_error,
+        }
+
+
+catalog_sync = CatalogSync()
+
+def encode_cursor(direction: str, key: int) -> str:
+    raw = json.dumps({"d": direction, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token: Optional[str], directions: Tuple[str, ...] = ("before", "after")) -> Optional[Tuple[str, int]]:
+    if not token:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if data.get("d") in directions:
+            return data["d"], int(data["k"])
+    except Exception:
+        pass
+    return None
+
+def page_args(default_limit: int) -> Tuple[int, Optional[int], Optional[int]]:
+    """Parse ``limit`` plus a keyset bound from ``cursor``, ``before`` or ``after``."""
+    try:
+        limit = max(1, min(int(request.args.get("limit", default_limit)), PAGE_LIMIT_MAX))
+    except Exception:
+        limit = default_limit
+    cur = decode_cursor(request.args.get("cursor"))
+    if cur:
+        return (limit, cur[1], None) if cur[0] == "before" else (limit, None, cur[1])
+    before = request.args.get("before")
+    if before and before.isdigit():
+        return limit, int(before), None
+    after = request.args.get("after")
+    if after and after.isdigit():
+        return limit, None, int(after)
+    return limit, None, None
+
+def wants_page() -> bool:
+    return any(k in request.args for k in ("limit", "cursor", "before", "after"))
+
+def profiles_page(conn: sqlite3.Connection, limit: int, after: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    rows = conn.execute(
+        "SELECT name, username, avatar, last_online, bg_from, bg_to, id FROM profiles WHERE id > ? ORDER BY id ASC LIMIT ?",
+        (after or 0, limit),
+    ).fetchall()
+    items = [
+        {"name": r[0], "username": r[1], "avatar": r[2], "lastOnline": r[3], "bgFrom": r[4], "bgTo": r[5]} for r in rows
+    ]
+    return items, encode_cursor("after", rows[-1][6]) if len(rows) == limit else None
 
 @app.route("/profiles", methods=["GET"])
+@conditional(lambda: ["profiles"])
 def get_profiles():
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT name, username, avatar, last_online, bg_from, bg_to FROM profiles")
-    rows = c.fetchall()
-    conn.close()
+    paged = wants_page()
+    if paged:
+        limit, before, after = page_args(100)
+        # Profiles page forward by id; a "before" bound pages backwards.
+        if before is not None:
+            c.execute(
+                "SELECT name, username, avatar, last_online, bg_from, bg_to, id FROM profiles WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before, limit),
+            )
+            rows = list(reversed(c.fetchall()))
+            next_cursor = encode_cursor("before", rows[0][6]) if len(rows) == limit else None
+        else:
+            items, next_cursor = profiles_page(conn, limit, after)
+            return jsonify({"items": items, "nextCursor": next_cursor})
+    else:
+        c.execute("SELECT name, username, avatar, last_online, bg_from, bg_to FROM profiles")
+        rows = c.fetchall()
     profiles = [
         {
             "name": row[0],
@@ -370,23 +2744,144 @@ def get_profiles():
         }
         for row in rows
     ]
+    if paged:
+        return jsonify({"items": profiles, "nextCursor": next_cursor})
     return jsonify(profiles)
 
+PROFILE_SEARCH_LIMIT_MAX = 25
+PROFILE_SEARCH_CANDIDATES = 200
+PROFILE_FUZZY_MIN = 0.7
+
+def _trigram_or_query(q: str) -> Optional[str]:
+    grams = sorted({q[i:i + 3] for i in range(len(q) - 2)})
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in grams) or None
+
+def _profile_match_score(q: str, username: str, name: str) -> float:
+    """1.0 exact username down to ~0.35 for a near-miss; 0 when it doesn't match."""
+    u, n = username.lower(), (name or "").lower()
+    words = n.split()
+    if u == q:
+        return 1.0
+    if u.startswith(q):
+        return 0.9
+    if n.startswith(q) or any(w.startswith(q) for w in words):
+        return 0.8
+    if q in u or q in n:
+        return 0.6
+    if len(q) < 3:
+        return 0.0
+    # Typos: compare against whole words and same-length prefixes of them.
+    targets = [u, u[: len(q)]] + words + [w[: len(q)] for w in words]
+    best = max(difflib.SequenceMatcher(None, q, t).ratio() for t in targets if t)
+    return best * 0.5 if best >= PROFILE_FUZZY_MIN else 0.0
+
+@app.route("/profiles/search", methods=["GET"])
+def search_profiles():
+    """Prefix, substring and fuzzy lookup on username and name for friend autocomplete."""
+    q = (request.args.get("q") or "").strip().lower()
+    me = (request.args.get("username") or "").strip()
+    if not q:
+        return jsonify({"items": []})
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), PROFILE_SEARCH_LIMIT_MAX))
+    except Exception:
+        limit = 10
+    conn = get_db()
+    ids: Set[int] = set()
+
+    def prefixed(prefix: str) -> None:
+        for column in ("username", "name"):
+            ids.update(r[0] for r in conn.execute(
+                f"SELECT id FROM profiles WHERE lower({column}) >= ? AND lower({column}) < ? LIMIT ?",
+                (prefix, prefix + "\U0010ffff", PROFILE_SEARCH_CANDIDATES),
+            ))
+
+    prefixed(q)
+    if len(q) >= 3:
+        ids.update(r[0] for r in conn.execute(
+            "SELECT rowid FROM profiles_fts WHERE profiles_fts MATCH ? LIMIT ?",
+            ('"' + q.replace('"', '""') + '"', PROFILE_SEARCH_CANDIDATES),
+        ))
+        if len(ids) < limit and len(q) >= 4:
+            ids.update(r[0] for r in conn.execute(
+                "SELECT rowid FROM profiles_fts WHERE profiles_fts MATCH ? ORDER BY rank LIMIT ?",
+                (_trigram_or_query(q), PROFILE_SEARCH_CANDIDATES),
+            ))
+        if len(ids) < limit:
+            # A typo can break every trigram; fall back to names sharing the first two letters.
+            prefixed(q[:2])
+    friend_set: Set[str] = set()
+    if me:
+        friend_set = {r[0] for r in conn.execute("SELECT friend_username FROM friends WHERE owner_username = ?", (me,))}
+    rows = []
+    if ids:
+        marks = ",".join("?" * len(ids))
+        rows = conn.execute(
+            f"SELECT name, username, avatar, last_online, bg_from, bg_to FROM profiles WHERE id IN ({marks})", list(ids)
+        ).fetchall()
+    seen = {r[1] for r in rows}
+    # Friends always compete, even when a short prefix matched many strangers first.
+    missing = [f for f in friend_set if f not in seen and q in f.lower()]
+    if missing:
+        marks = ",".join("?" * len(missing))
+        rows += conn.execute(
+            f"SELECT name, username, avatar, last_online, bg_from, bg_to FROM profiles WHERE username IN ({marks})", missing
+        ).fetchall()
+    scored = []
+    for r in rows:
+        if r[1] == me:
+            continue
+        score = _profile_match_score(q, r[1], r[0])
+        if score > 0:
+            scored.append((score, r))
+    mutual: Dict[str, int] = {}
+    if me and scored:
+        names = [r[1] for _, r in scored]
+        marks = ",".join("?" * len(names))
+        mutual = dict(conn.execute(
+            f"SELECT owner_username, COUNT(*) FROM friends WHERE owner_username IN ({marks}) "
+            "AND friend_username IN (SELECT friend_username FROM friends WHERE owner_username = ?) GROUP BY owner_username",
+            names + [me],
+        ).fetchall())
+
+    def relation(uname: str) -> Optional[str]:
+        if uname in friend_set:
+            return "friend"
+        return "friend_of_friend" if mutual.get(uname) else None
+
+    tiers = {"friend": 0, "friend_of_friend": 1, None: 2}
+    scored.sort(key=lambda sr: (
+        sr[0] < 1.0, tiers[relation(sr[1][1])], -sr[0], -mutual.get(sr[1][1], 0), sr[1][1].lower()
+    ))
+    items = [
+        {
+            "name": r[0],
+            "username": r[1],
+            "avatar": r[2],
+            "lastOnline": r[3],
+            "bgFrom": r[4],
+            "bgTo": r[5],
+            "relation": relation(r[1]),
+            "mutualFriends": mutual.get(r[1], 0),
+        }
+        for _, r in scored[:limit]
+    ]
+    return jsonify({"items": items})
+
 @app.route("/signin", methods=["POST"])
 def signin():
     data = request.get_json()
     username = data.get("username")
     if not username:
         return jsonify({"error": "No username provided"}), 400
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("UPDATE profiles SET last_online = 'Online now' WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
+    presence.heartbeat(username)
     print(f"User {username} signed in.")
-    if username:
-        seed_user_library(username)
-    return jsonify({"status": "success", "message": f"User {username} signed in successfully!"})
+    job = enqueue_library_seed(username)
+    return jsonify({
+        "status": "success",
+        "message": f"User {username} signed in successfully!",
+        "libraryJob": job["id"],
+    })
 
 @app.route("/signup", methods=["POST"])
 def signup():
@@ -398,34 +2893,98 @@ def signup():
     bg_to = data.get("bgTo", "#feb47b")
     if not name or not username:
         return jsonify({"error": "Name and username are required"}), 400
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute("""
             INSERT INTO profiles (name, username, avatar, last_online, bg_from, bg_to)
             VALUES (?, ?, ?, ?, ?, ?)
-        """, (name, username, avatar, "Online now", bg_from, bg_to))
+        """, (name, username, avatar, iso_timestamp(time.time()), bg_from, bg_to))
         conn.commit()
     except sqlite3.IntegrityError:
-        conn.close()
         return jsonify({"error": "Username already exists"}), 400
-    conn.close()
+    presence.heartbeat(username)
     print(f"New user {username} signed up.")
-    if username:
-        seed_user_library(username)
+    job = enqueue_library_seed(username)
     return jsonify({
         "status": "success",
         "message": f"User {username} signed up successfully!",
+        "libraryJob": job["id"],
         "user": {
             "name": name,
             "username": username,
             "avatar": avatar,
-            "lastOnline": "Online now",
+            "lastOnline": iso_timestamp(time.time()),
             "bgFrom": bg_from,
             "bgTo": bg_to
         }
     }), 201
 
+@app.route("/presence/heartbeat", methods=["POST"])
+def presence_heartbeat():
+    """Record that a user is active, optionally with the game they are playing."""
+    data = request.get_json(silent=True) or {}
+    username = data.get("username")
+    if not username:
+        return jsonify({"error": "No username provided"}), 400
+    game_id = data.get("gameId")
+    try:
+        game_id = int(game_id) if game_id is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "gameId must be an integer"}), 400
+    game_name = str(data.get("gameName") or "")[:200] or None
+    online = data.get("status", "online") != "offline"
+    presence.heartbeat(username, online, game_id if online else None, game_name if online else None)
+    return jsonify({"status": "ok", "ttl": presence.ttl})
+
+@app.route("/presence", methods=["GET"])
+def presence_query():
+    """Presence for ``users`` (comma-separated) or for every friend of ``friendsOf``."""
+    conn = get_db()
+    owner = request.args.get("friendsOf")
+    if owner:
+        usernames = [
+            r[0] for r in conn.execute(
+                "SELECT friend_username FROM friends WHERE owner_username = ? LIMIT ?", (owner, PRESENCE_QUERY_MAX)
+            )
+        ]
+    else:
+        usernames = [u for u in (request.args.get("users") or "").split(",") if u][:PRESENCE_QUERY_MAX]
+    found = presence.lookup(conn, usernames)
+    items = [
+        found.get(u) or {"username": u, "online": False, "lastSeen": None, "game": None}
+        for u in usernames
+    ]
+    return jsonify({"items": items, "ttl": presence.ttl})
+
+def _fetch_games_items(limit: int, offset: int) -> List[dict]:
+    q = (
+        "fields id,name,cover.image_id,total_rating_count; "
+        "where cover != null & version_parent = null; "
+        f"sort total_rating_count desc; limit {limit}; offset {offset};"
+    )
+    q_fallback = (
+        "fields id,name,cover.image_id,total_rating_count; "
+        "where cover != null; "
+        f"sort total_rating_count desc; limit {limit}; offset {offset};"
+    )
+    arr = igdb.query(q, name="games", fallback=q_fallback)
+    out = []
+    for g in arr:
+        cover = (g.get("cover") or {}).get("image_id")
+        if not cover:
+            continue
+        out.append(
+            {
+                "id": g.get("id"),
+                "name": g.get("name"),
+                "coverUrl": image_url("cover", cover),
+                "coverUrl2x": image_url("cover2x", cover),
+                "popularity": float(g.get("total_rating_count") or 0.0),
+            }
+        )
+    return out
+
 @app.route("/games", methods=["GET"])
 def games_list():
     try:
@@ -436,106 +2995,44 @@ def games_list():
         offset = max(0, int(request.args.get("offset", 0)))
     except Exception:
         offset = 0
-    client_id = os.getenv("IGDB_CLIENT_ID")
-    access_token = ensure_igdb_token()
-    if client_id and access_token and requests is not None:
-        try:
-            q = (
-                "fields id,name,cover.image_id,total_rating_count; "
-                "where cover != null & version_parent = null; "
-                f"sort total_rating_count desc; limit {limit}; offset {offset};"
-            )
-            resp = requests.post(
-                "https://api.igdb.com/v4/games",
-                data=q,
-                headers={
-                    "Client-ID": client_id,
-                    "Authorization": f"Bearer {access_token}",
-                    "Accept": "application/json",
-                    "Content-Type": "text/plain",
-                },
-                timeout=10,
-            )
-            if resp.status_code in (401, 403):
-                os.environ.pop("IGDB_ACCESS_TOKEN", None)
-                access_token2 = ensure_igdb_token()
-                if access_token2:
-                    resp = requests.post(
-                        "https://api.igdb.com/v4/games",
-                        data=q,
-                        headers={
-                            "Client-ID": client_id,
-                            "Authorization": f"Bearer {access_token2}",
-                            "Accept": "application/json",
-                            "Content-Type": "text/plain",
-                        },
-                        timeout=10,
-                    )
-            if not resp.ok:
-                print("IGDB games list HTTP", resp.status_code, "->", resp.text[:300])
-                if resp.status_code == 400:
-                    q_fallback = (
-                        "fields id,name,cover.image_id,total_rating_count; "
-                        "where cover != null; "
-                        f"sort total_rating_count desc; limit {limit}; offset {offset};"
-                    )
-                    resp = requests.post(
-                        "https://api.igdb.com/v4/games",
-                        data=q_fallback,
-                        headers={
-                            "Client-ID": client_id,
-                            "Authorization": f"Bearer {access_token}",
-                            "Accept": "application/json",
-                            "Content-Type": "text/plain",
-                        },
-                        timeout=10,
-                    )
-                if not resp.ok:
-                    resp.raise_for_status()
-            arr = resp.json()
-            out = []
-            for g in arr:
-                cover = (g.get("cover") or {}).get("image_id")
-                if not cover:
-                    continue
-                out.append(
-                    {
-                        "id": g.get("id"),
-                        "name": g.get("name"),
-                        "coverUrl": f"https://images.igdb.com/igdb/image/upload/t_cover_big/{cover}.jpg",
-                        "popularity": float(g.get("total_rating_count") or 0.0),
-                    }
-                )
-            username = request.args.get("username")
-            installed_ids: Set[int] = set()
-            if username:
-                try:
-                    conn = sqlite3.connect(DB_NAME)
-                    c = conn.cursor()
-                    c.execute("SELECT game_id FROM library WHERE owner_username = ?", (username,))
-                    installed_ids = {int(r[0]) for r in c.fetchall() if str(r[0]).isdigit()}
-                    conn.close()
-                except Exception:
-                    installed_ids = set()
-            if not installed_ids:
-                for i, it in enumerate(out):
-                    it["installed"] = i < 3
-            else:
-                for it in out:
-                    try:
-                        it["installed"] = int(it["id"]) in installed_ids
-                    except Exception:
-                        it["installed"] = False
-            return jsonify(out)
-        except Exception as ex:
-            print("IGDB games list failed:", ex)
-            return jsonify([])
-    print("[games_list] IGDB not configured. Returning empty list.")
-    return jsonify([])
+    out = _local_games(get_db(), limit, offset)
+    if out is None:
+        out = _remote_games(limit, offset)
+    return jsonify(_mark_installed(out, request.args.get("username")))
+
+def _local_games(conn: sqlite3.Connection, limit: int, offset: int) -> Optional[List[dict]]:
+    """A page of the synced catalog, or None while it is still empty."""
+    try:
+        if catalog_ready(conn):
+            return [
+                {
+                    "id": it["id"],
+                    "name": it["name"],
+                    "coverUrl": it["coverUrl"],
+                    "coverUrl2x": it["coverUrl2x"],
+                    "popularity": it["popularity"],
+                }
+                for it in catalog_page(conn, "popularity", limit, offset)
+            ]
+    except Exception as ex:
+        print("local catalog read failed:", ex)
+    return None
+
+def _remote_games(limit: int, offset: int) -> List[dict]:
+    if not igdb.is_configured():
+        print("[games_list] IGDB not configured. Returning empty list.")
+        return []
+    try:
+        cached = catalog_cache.get_or_load(("games", limit, offset), lambda: _fetch_games_items(limit, offset))
+        return [dict(it) for it in cached]
+    except Exception as ex:
+        print("IGDB games list failed:", ex)
+        return []
 
 @app.route("/friends/<username>", methods=["GET", "POST"])
+@conditional(lambda username: [f"friends:{username}"])
 def friends(username):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     if request.method == "POST":
         data = request.get_json() or {}
@@ -563,7 +3060,6 @@ def friends(username):
         (username,),
     )
     rows = [r[0] for r in c.fetchall()]
-    conn.close()
     return jsonify(rows)
 
 # Create a friend request
@@ -576,7 +3072,7 @@ def create_friend_request():
         return jsonify({"error": "from and to required"}), 400
     if from_user == to_user:
         return jsonify({"error": "cannot add yourself"}), 400
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     # If already friends, short-circuit
     c.execute(
@@ -584,7 +3080,6 @@ def create_friend_request():
         (from_user, to_user),
     )
     if c.fetchone():
-        conn.close()
         return jsonify({"status": "already_friends"}), 200
     # Avoid duplicate pending requests in either direction
     c.execute(
@@ -597,7 +3092,6 @@ def create_friend_request():
     )
     row = c.fetchone()
     if row and (row[1] == "pending"):
-        conn.close()
         return jsonify({"status": "already_pending", "id": row[0]}), 200
     c.execute(
         "INSERT INTO friend_requests (from_username, to_username, status) VALUES (?, ?, 'pending')",
@@ -605,40 +3099,64 @@ def create_friend_request():
     )
     req_id = c.lastrowid
     conn.commit()
-    conn.close()
     return jsonify({"id": req_id, "from": from_user, "to": to_user, "status": "pending"}), 201
 
 # List incoming/outgoing friend requests for a user
 @app.route("/friend_requests/<username>", methods=["GET"])
 def list_friend_requests(username: str):
     only = (request.args.get("status") or "pending").strip().lower()
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    if only == "all":
-        c.execute("SELECT id, from_username, to_username, status, created_at FROM friend_requests WHERE to_username = ? ORDER BY id DESC", (username,))
-        incoming = [{"id": r[0], "from": r[1], "to": r[2], "status": r[3], "createdAt": r[4]} for r in c.fetchall()]
-        c.execute("SELECT id, from_username, to_username, status, created_at FROM friend_requests WHERE from_username = ? ORDER BY id DESC", (username,))
-        outgoing = [{"id": r[0], "from": r[1], "to": r[2], "status": r[3], "createdAt": r[4]} for r in c.fetchall()]
-    else:
-        c.execute("SELECT id, from_username, to_username, status, created_at FROM friend_requests WHERE to_username = ? AND status = 'pending' ORDER BY id DESC", (username,))
-        incoming = [{"id": r[0], "from": r[1], "to": r[2], "status": r[3], "createdAt": r[4]} for r in c.fetchall()]
-        c.execute("SELECT id, from_username, to_username, status, created_at FROM friend_requests WHERE from_username = ? AND status = 'pending' ORDER BY id DESC", (username,))
-        outgoing = [{"id": r[0], "from": r[1], "to": r[2], "status": r[3], "createdAt": r[4]} for r in c.fetchall()]
-    conn.close()
-    return jsonify({"incoming": incoming, "outgoing": outgoing})
+    box = (request.args.get("box") or "").strip().lower()
+    limit, before, after = page_args(100)
+    since_id = request.args.get("sinceId")
+    if after is None and before is None and since_id and since_id.isdigit():
+        after = int(since_id)
+    return jsonify(friend_requests_for(get_db(), username, only == "all", box, limit, before, after))
+
+def friend_requests_for(
+    conn: sqlite3.Connection, username: str, include_all: bool = False, box: str = "",
+    limit: int = 100, before: Optional[int] = None, after: Optional[int] = None,
+) -> dict:
+    def fetch(column: str) -> Tuple[List[dict], Optional[str]]:
+        where = [f"{column} = ?"]
+        params: List[Any] = [username]
+        if not include_all:
+            where.append("status = 'pending'")
+        # Newest first by default; an "after" bound pages forward to newer requests, oldest first.
+        if after is not None:
+            where.append("id > ?")
+            params.append(after)
+        elif before is not None:
+            where.append("id < ?")
+            params.append(before)
+        params.append(limit)
+        rows = conn.execute(
+            "SELECT id, from_username, to_username, status, created_at FROM friend_requests "
+            f"WHERE {' AND '.join(where)} ORDER BY id {'ASC' if after is not None else 'DESC'} LIMIT ?",
+            params,
+        ).fetchall()
+        items = [{"id": r[0], "from": r[1], "to": r[2], "status": r[3], "createdAt": r[4]} for r in rows]
+        if len(rows) < limit:
+            return items, None
+        return items, encode_cursor("after" if after is not None else "before", rows[-1][0])
+
+    incoming, next_in = fetch("to_username") if box in ("", "incoming") else ([], None)
+    outgoing, next_out = fetch("from_username") if box in ("", "outgoing") else ([], None)
+    return {
+        "incoming": incoming,
+        "outgoing": outgoing,
+        "nextCursor": {"incoming": next_in, "outgoing": next_out},
+    }
 
 # Accept a friend request
 @app.route("/friend_requests/<int:req_id>/accept", methods=["POST"])
 def accept_friend_request(req_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT from_username, to_username, status FROM friend_requests WHERE id = ?", (req_id,))
     row = c.fetchone()
     if not row:
-        conn.close()
         return jsonify({"error": "not found"}), 404
     if row[2] != "pending":
-        conn.close()
         return jsonify({"status": row[2]}), 200
     from_user, to_user = row[0], row[1]
     # Mark accepted
@@ -653,30 +3171,27 @@ def accept_friend_request(req_id: int):
     except Exception:
         pass
     conn.commit()
-    conn.close()
     return jsonify({"status": "accepted", "from": from_user, "to": to_user})
 
 # Decline a friend request
 @app.route("/friend_requests/<int:req_id>/decline", methods=["POST"])
 def decline_friend_request(req_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT from_username, to_username, status FROM friend_requests WHERE id = ?", (req_id,))
     row = c.fetchone()
     if not row:
-        conn.close()
         return jsonify({"error": "not found"}), 404
     if row[2] != "pending":
-        conn.close()
         return jsonify({"status": row[2]}), 200
     c.execute("UPDATE friend_requests SET status = 'declined' WHERE id = ?", (req_id,))
     conn.commit()
-    conn.close()
     return jsonify({"status": "declined"})
 
 @app.route("/library/<username>", methods=["GET", "POST"])
+@conditional(lambda username: [f"library:{username}"])
 def library(username):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     if request.method == "POST":
         data = request.get_json() or {}
@@ -685,18 +3200,71 @@ def library(username):
         if not game_id or not game_name:
             return jsonify({"error": "id and name required"}), 400
         c.execute(
-            "INSERT INTO library (owner_username, game_id, game_name) VALUES (?, ?, ?)",
+            "INSERT OR IGNORE INTO library (owner_username, game_id, game_name) VALUES (?, ?, ?)",
             (username, str(game_id), game_name),
         )
         conn.commit()
+    version = data_versions(conn, [f"library:{username}"])[0]
     c.execute(
         "SELECT game_id, game_name FROM library WHERE owner_username = ?",
         (username,),
     )
     rows = [{"id": r[0], "name": r[1]} for r in c.fetchall()]
-    conn.close()
+    # The committed row list is authoritative, so refresh the owned-set cache from it.
+    owned_games_cache.put(username, (version, _owned_set(r["id"] for r in rows)))
     return jsonify(rows)
 
+@app.route("/library/<username>/status", methods=["GET"])
+def library_status(username):
+    job = jobs.get_by_key(f"seed:{username}")
+    row = get_db().execute("SELECT 1 FROM library WHERE owner_username = ? LIMIT 1", (username,)).fetchone()
+    pending = bool(job and job["status"] in ("queued", "running"))
+    return jsonify({"username": username, "ready": bool(row) and not pending, "job": job})
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
+
+def dm_key(a: str, b: str) -> str:
+    return f"dm:{','.join(sorted([a, b]))}"
+
+def get_or_create_dm(conn: sqlite3.Connection, a: str, b: str, created_by: str) -> Tuple[int, str, bool]:
+    """Return ``(channel_id, name, created)`` for the DM between ``a`` and ``b``."""
+    key = dm_key(a, b)
+    c = conn.cursor()
+    c.execute(
+        "INSERT INTO channels (name, created_by, dm_key) VALUES (?, ?, ?) "
+        "ON CONFLICT(dm_key) WHERE dm_key IS NOT NULL DO NOTHING",
+        (key, created_by, key),
+    )
+    created = c.rowcount == 1
+    channel_id = c.execute("SELECT id FROM channels WHERE dm_key = ?", (key,)).fetchone()[0]
+    c.executemany(
+        "INSERT OR IGNORE INTO channel_members (channel_id, username) VALUES (?, ?)",
+        [(channel_id, a), (channel_id, b)],
+    )
+    conn.commit()
+    return channel_id, key, created
+
+@app.route("/channels/dm", methods=["POST"])
+def dm_channel():
+    data = request.get_json() or {}
+    username = (data.get("username") or "").strip()
+    friend = (data.get("friend") or "").strip()
+    if not username or not friend:
+        return jsonify({"error": "username and friend required"}), 400
+    if username == friend:
+        return jsonify({"error": "cannot message yourself"}), 400
+    try:
+        channel_id, name, created = get_or_create_dm(get_db(), username, friend, username)
+    except Exception as ex:
+        print("dm channel failed:", ex)
+        return jsonify({"error": "failed"}), 500
+    return jsonify({"id": channel_id, "name": name, "created": created}), (201 if created else 200)
+
 @app.route("/channels", methods=["POST"])
 def create_channel():
     data = request.get_json() or {}
@@ -710,8 +3278,17 @@ def create_channel():
     if created_by not in members:
         members.append(created_by)
     members = [m.strip() for m in members if isinstance(m, str) and m.strip()]
+    # Older clients create DMs here; keep them on the deduplicated path.
+    others = [m for m in set(members) if m != created_by]
+    if len(others) == 1 and name == dm_key(created_by, others[0]):
+        try:
+            channel_id, name, _ = get_or_create_dm(get_db(), created_by, others[0], created_by)
+            return jsonify({"id": channel_id, "name": name})
+        except Exception as ex:
+            print("create_channel failed:", ex)
+            return jsonify({"error": "failed"}), 500
     try:
-        conn = sqlite3.connect(DB_NAME)
+        conn = get_db()
         c = conn.cursor()
         c.execute("INSERT INTO channels (name, created_by) VALUES (?, ?)", (name, created_by))
         channel_id = c.lastrowid
@@ -721,7 +3298,6 @@ def create_channel():
             except Exception:
                 pass
         conn.commit()
-        conn.close()
         return jsonify({"id": channel_id, "name": name})
     except Exception as ex:
         print("create_channel failed:", ex)
@@ -729,9 +3305,10 @@ def create_channel():
 
 @app.route("/channels/<username>", methods=["GET"])
 def list_channels(username):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute(
+    return jsonify(channels_for(get_db(), username))
+
+def channels_for(conn: sqlite3.Connection, username: str) -> List[dict]:
+    rows = conn.execute(
         """
         SELECT channels.id, channels.name
         FROM channels
@@ -740,121 +3317,378 @@ def list_channels(username):
         ORDER BY channels.id DESC
         """,
         (username,),
-    )
-    out = [{"id": r[0], "name": r[1]} for r in c.fetchall()]
-    conn.close()
-    return jsonify(out)
+    ).fetchall()
+    return [{"id": r[0], "name": r[1]} for r in rows]
 
 @app.route("/channels/<int:channel_id>/members", methods=["GET", "POST"])
 def channel_members_route(channel_id: int):
-    conn = sqlite3.connect(DB_NAME)
+    conn = get_db()
     c = conn.cursor()
     if request.method == "POST":
         data = request.get_json() or {}
         username = (data.get("username") or "").strip()
         if not username:
-            conn.close()
             return jsonify({"error": "username required"}), 400
         try:
             c.execute("INSERT OR IGNORE INTO channel_members (channel_id, username) VALUES (?, ?)", (channel_id, username))
             conn.commit()
         except Exception as ex:
             print("add member failed:", ex)
-            conn.close()
             return jsonify({"error": "failed"}), 500
     c.execute("SELECT username FROM channel_members WHERE channel_id = ? ORDER BY username", (channel_id,))
     rows = [r[0] for r in c.fetchall()]
-    conn.close()
     return jsonify(rows)
 
+def channel_history(conn: sqlite3.Connection, channel_id: int, limit: int, before: Optional[int] = None,
+                    after: Optional[int] = None) -> List[dict]:
+    """Up to ``limit`` messages, oldest first: the oldest above ``after``, else the newest below ``before``."""
+    own_txn = not conn.in_transaction
+    if own_txn:
+        conn.execute("BEGIN")
+    try:
+        if after is not None:
+            out: List[dict] = []
+            segments = conn.execute(
+                "SELECT first_id FROM message_segments WHERE channel_id = ? AND last_id > ? ORDER BY last_id LIMIT ?",
+                (channel_id, after, limit),
+            ).fetchall()
+            for (first_id,) in segments:
+                out.extend(m for m in message_archive.load(channel_id, first_id) if m["id"] > after)
+                if len(out) >= limit:
+                    return out[:limit]
+            rows = conn.execute(
+                "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+                (channel_id, out[-1]["id"] if out else after, limit - len(out)),
+            ).fetchall()
+            return out + [{"id": r[0], "sender": r[1], "text": r[2], "createdAt": r[3]} for r in rows]
+        rows = conn.execute(
+            "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            (channel_id, before if before is not None else 2 ** 63 - 1, limit),
+        ).fetchall()
+        out = [{"id": r[0], "sender": r[1], "text": r[2], "createdAt": r[3]} for r in reversed(rows)]
+        if len(out) < limit:
+            bound = out[0]["id"] if out else (before if before is not None else 2 ** 63 - 1)
+            segments = conn.execute(
+                "SELECT first_id FROM message_segments WHERE channel_id = ? AND first_id < ? ORDER BY first_id DESC LIMIT ?",
+                (channel_id, bound, limit - len(out)),
+            ).fetchall()
+            for (first_id,) in segments:
+                out = [m for m in message_archive.load(channel_id, first_id) if m["id"] < bound] + out
+                if len(out) >= limit:
+                    break
+            out = out[-limit:]
+        return out
+    finally:
+        if own_txn:
+            conn.commit()
+
+def _messages_after(conn: sqlite3.Connection, channel_id: int, since_id: int, limit: int = MESSAGE_SINCE_MAX) -> List[dict]:
+    return channel_history(conn, channel_id, limit, after=since_id)
+
+def _wait_for_messages(channel_id: int, since_id: int, wait: float) -> List[dict]:
+    latest = message_broker.latest(channel_id)
+    if latest is None or latest > since_id:
+        conn = get_db()
+        out = _messages_after(conn, channel_id, since_id)
+        if out:
+            message_broker.observe(channel_id, out[-1]["id"])
+            return out
+        row = conn.execute("SELECT MAX(id) FROM messages WHERE channel_id = ?", (channel_id,)).fetchone()
+        message_broker.observe(channel_id, int(row[0] or 0))
+    # Don't hold a pooled connection while blocked.
+    release_db()
+    if not message_broker.wait(channel_id, since_id, wait):
+        return []
+    return _messages_after(get_db(), channel_id, since_id)
+
 @app.route("/channels/<int:channel_id>/messages", methods=["GET", "POST"])
 def channel_messages(channel_id: int):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
+    since_id = request.args.get("sinceId")
+    if request.method == "GET" and since_id and str(since_id).isdigit() and request.args.get("wait"):
+        try:
+            wait = max(0.0, min(float(request.args.get("wait")), MESSAGE_WAIT_MAX))
+        except Exception:
+            wait = 0.0
+        if wait:
+            return jsonify(_wait_for_messages(channel_id, int(since_id), wait))
     if request.method == "POST":
         data = request.get_json() or {}
         sender = (data.get("sender") or "").strip()
         text = (data.get("text") or "").strip()
         if not sender or not text:
-            conn.close()
             return jsonify({"error": "sender and text required"}), 400
+        client_id = str(data.get("clientId") or "").strip()[:64] or None
+        # Returns the stored row, so the sender needs no follow-up read to see it. A failed send may
+        # still have committed; retrying with the same clientId returns that row instead of a copy.
         try:
-            c.execute(
-                "INSERT INTO messages (channel_id, sender, text) VALUES (?, ?, ?)",
-                (channel_id, sender, text),
-            )
-            conn.commit()
+            fut = message_writer.submit(channel_id, sender, text, client_id)
+            message = fut.result(timeout=DB_BUSY_TIMEOUT_MS / 1000.0 + 5)
         except Exception as ex:
             print("insert message failed:", ex)
-            conn.close()
             return jsonify({"error": "failed"}), 500
-    since_id = request.args.get("sinceId")
+        return jsonify(message), 201
+    conn = get_db()
+    if wants_page():
+        limit, before, after = page_args(50)
+        if after is not None:
+            out = _messages_after(conn, channel_id, after, limit)
+            next_cursor = encode_cursor("after", out[-1]["id"]) if len(out) == limit else None
+        else:
+            out = channel_history(conn, channel_id, limit, before=before)
+            next_cursor = encode_cursor("before", out[0]["id"]) if len(out) == limit else None
+        return jsonify({"items": out, "nextCursor": next_cursor})
+    # Legacy sinceId catch-up is capped; clients keep polling from the last id they got.
     if since_id and str(since_id).isdigit():
-        c.execute(
-            "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? AND id > ? ORDER BY id ASC",
-            (channel_id, int(since_id)),
-        )
-    else:
-        c.execute(
-            "SELECT id, sender, text, created_at FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT 50",
-            (channel_id,),
-        )
-    rows = c.fetchall()
-    conn.close()
-    if not (since_id and str(since_id).isdigit()):
-        rows = list(reversed(rows))
-    out = [
-        {"id": r[0], "sender": r[1], "text": r[2], "createdAt": r[3]}
-        for r in rows
-    ]
+        return jsonify(_messages_after(conn, channel_id, int(since_id)))
+    return jsonify(channel_history(conn, channel_id, 50))
+
+SEARCH_LIMIT_MAX = 50
+SEARCH_OFFSET_MAX = 1000
+_HIT_OPEN, _HIT_CLOSE = "\x02", "\x03"
+
+def fts_query(text: str, column: Optional[str] = None, prefix: bool = False) -> Optional[str]:
+    """Turn free text into a safe FTS5 query in which every word must match."""
+    words = [w.replace('"', "") for w in text.split()]
+    words = [w for w in words if w]
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*' if prefix else f'"{words[-1]}"']
+    expr = " ".join(terms)
+    return f"{column}: ({expr})" if column else expr
+
+def _snippet_parts(snippet: str) -> List[dict]:
+    parts = []
+    for i, chunk in enumerate(snippet.split(_HIT_OPEN)):
+        if i == 0:
+            plain, hit = chunk, ""
+        else:
+            hit, _, plain = chunk.partition(_HIT_CLOSE)
+        if hit:
+            parts.append({"text": hit, "hit": True})
+        if plain:
+            parts.append({"text": plain, "hit": False})
+    return parts
+
+@app.route("/messages/search", methods=["GET"])
+def search_messages():
+    """Ranked full-text search over the messages in channels ``username`` belongs to."""
+    username = (request.args.get("username") or "").strip()
+    match = fts_query(request.args.get("q") or "", "text", request.args.get("prefix") in ("1", "true"))
+    if not username or not match:
+        return jsonify({"error": "username and q required"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), SEARCH_LIMIT_MAX))
+    except Exception:
+        limit = 20
+    sort = request.args.get("sort") or "rank"
+    conn = get_db()
+    channel_ids = [r[0] for r in conn.execute("SELECT channel_id FROM channel_members WHERE username = ?", (username,))]
+    channel_id = request.args.get("channelId")
+    if channel_id:
+        channel_ids = [cid for cid in channel_ids if str(cid) == channel_id]
+    if not channel_ids:
+        return jsonify({"items": [], "nextCursor": None})
+    text_match = match
+    match += " AND chan: (" + " OR ".join(f"c{cid}" for cid in channel_ids) + ")"
+    cursor = decode_cursor(request.args.get("cursor"), ("before", "offset"))
+    # LEFT JOIN: archived hits keep their index entries after the hot row is gone.
+    select = (
+        "SELECT messages_fts.rowid, m.channel_id, m.sender, m.created_at, m.text, bm25(messages_fts) "
+        "FROM messages_fts LEFT JOIN messages m ON m.id = messages_fts.rowid WHERE messages_fts MATCH ? "
+    )
+    try:
+        if sort == "recent":
+            before = cursor[1] if cursor and cursor[0] == "before" else 2 ** 63 - 1
+            rows = conn.execute(
+                select + "AND messages_fts.rowid < ? ORDER BY messages_fts.rowid DESC LIMIT ?", (match, before, limit)
+            ).fetchall()
+            next_cursor = encode_cursor("before", rows[-1][0]) if len(rows) == limit else None
+        else:
+            offset = cursor[1] if cursor and cursor[0] == "offset" else 0
+            rows = conn.execute(
+                select + "ORDER BY rank, messages_fts.rowid DESC LIMIT ? OFFSET ?", (match, limit, offset)
+            ).fetchall()
+            more = len(rows) == limit and offset + limit < SEARCH_OFFSET_MAX
+            next_cursor = encode_cursor("offset", offset + limit) if more else None
+    except sqlite3.OperationalError as ex:
+        print("message search failed:", ex)
+        return jsonify({"error": "bad query"}), 400
+    items = []
+    for r in rows:
+        item = {"id": r[0], "channelId": r[1], "sender": r[2], "createdAt": r[3], "text": r[4], "score": round(-r[5], 4)}
+        if r[1] is None:
+            archived = _archived_message(conn, channel_ids, r[0])
+            if archived is None:
+                continue
+            item.update(archived)
+        items.append(item)
+    snippets = _search_snippets(text_match, [item.pop("text") for item in items])
+    for item, snippet in zip(items, snippets):
+        item["snippet"] = _snippet_parts(snippet)
+    return jsonify({"items": items, "nextCursor": next_cursor})
+
+def _archived_message(conn: sqlite3.Connection, channel_ids: List[int], message_id: int) -> Optional[dict]:
+    marks = ",".join("?" * len(channel_ids))
+    seg = conn.execute(
+        f"SELECT channel_id, first_id FROM message_segments WHERE channel_id IN ({marks}) "
+        "AND first_id <= ? AND last_id >= ?",
+        (*channel_ids, message_id, message_id),
+    ).fetchone()
+    if seg is None:
+        return None
+    for row in message_archive.load(seg[0], seg[1]):
+        if row["id"] == message_id:
+            return {"channelId": seg[0], "sender": row["sender"], "createdAt": row["createdAt"], "text": row["text"]}
+    return None
+
+def _search_snippets(match: str, texts: List[str]) -> List[str]:
+    # snippet() needs the content row, which archived hits no longer have; re-run the
+    # match over just this page's texts in a scratch index.
+    scratch = sqlite3.connect(":memory:")
+    try:
+        scratch.execute("CREATE VIRTUAL TABLE s USING fts5(text, tokenize='unicode61 remove_diacritics 2')")
+        scratch.executemany("INSERT INTO s (rowid, text) VALUES (?, ?)", enumerate(texts))
+        found = dict(scratch.execute(
+            f"SELECT rowid, snippet(s, 0, '{_HIT_OPEN}', '{_HIT_CLOSE}', '…', 16) FROM s WHERE s MATCH ?", (match,)
+        ).fetchall())
+    finally:
+        scratch.close()
+    return [found.get(i, text) for i, text in enumerate(texts)]
+
+BOOTSTRAP_FIELDS = ("profile", "friends", "requests", "library", "channels", "games")
+# Opt-in first pages for the profile picker and the store; "profiles" needs no username.
+BOOTSTRAP_EXTRA_FIELDS = ("profiles", "store")
+BOOTSTRAP_USER_FIELDS = ("profile", "friends", "requests", "library", "channels")
+BOOTSTRAP_GAMES_LIMIT = 60
+BOOTSTRAP_PROFILES_LIMIT = 100
+# Runs the parts of a bootstrap that don't come from SQLite (the IGDB games fallback).
+bootstrap_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bootstrap")
+
+def _bootstrap_fields() -> List[str]:
+    raw = request.args.get("fields")
+    if not raw:
+        return list(BOOTSTRAP_FIELDS)
+    wanted = {f.strip() for f in raw.split(",")}
+    return [f for f in BOOTSTRAP_FIELDS + BOOTSTRAP_EXTRA_FIELDS if f in wanted]
+
+def _bootstrap_scopes(username: Optional[str] = None) -> Optional[List[str]]:
+    username = username or request.args.get("username") or None
+    library = [f"library:{username}"] if username else []
+    scopes = {
+        "profile": ["profiles"],
+        "friends": [f"friends:{username}", "profiles"],
+        "requests": [f"requests:{username}"],
+        "library": library,
+        "channels": [f"channels:{username}"],
+        "games": ["games"] + library,
+        "profiles": ["profiles"],
+        "store": ["games"] + library,
+    }
+    fields = _bootstrap_fields()
+    if not username and any(f in BOOTSTRAP_USER_FIELDS for f in fields):
+        return None
+    if ("games" in fields or "store" in fields) and not catalog_ready(get_db()):
+        return None
+    return sorted({name for f in fields for name in scopes[f]})
+
+@app.route("/bootstrap", methods=["GET"])
+@app.route("/bootstrap/<username>", methods=["GET"])
+@conditional(_bootstrap_scopes)
+def bootstrap(username: Optional[str] = None):
+    """First-paint data for a page in one call; ``fields`` picks what to include."""
+    username = username or request.args.get("username") or None
+    fields = _bootstrap_fields()
+    if not username and any(f in BOOTSTRAP_USER_FIELDS for f in fields):
+        return jsonify({"error": "username required"}), 400
+    store_sort = (request.args.get("storeSort") or "rating").lower()
+    conn = get_db()
+    out: Dict[str, Any] = {}
+    remote_games = None
+    remote_store = None
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    try:
+        if "games" in fields:
+            out["games"] = _local_games(conn, BOOTSTRAP_GAMES_LIMIT, 0)
+            if out["games"] is None:
+                remote_games = bootstrap_executor.submit(_remote_games, BOOTSTRAP_GAMES_LIMIT, 0)
+        if "store" in fields:
+            out["store"] = catalog_page(conn, store_sort, BOOTSTRAP_GAMES_LIMIT, 0) if catalog_ready(conn) else None
+            if out["store"] is None:
+                remote_store = bootstrap_executor.submit(_remote_store, store_sort, BOOTSTRAP_GAMES_LIMIT, 0)
+        if "profiles" in fields:
+            items, next_cursor = profiles_page(conn, BOOTSTRAP_PROFILES_LIMIT)
+            out["profiles"] = {"items": items, "nextCursor": next_cursor}
+        if "profile" in fields:
+            row = conn.execute(
+                "SELECT name, username, avatar, last_online, bg_from, bg_to FROM profiles WHERE username = ?", (username,)
+            ).fetchone()
+            if row is None:
+                return jsonify({"error": "not found"}), 404
+            out["profile"] = {
+                "name": row[0], "username": row[1], "avatar": row[2], "lastOnline": row[3], "bgFrom": row[4], "bgTo": row[5],
+            }
+        if "friends" in fields:
+            rows = conn.execute(
+                """
+                SELECT f.friend_username, p.name, p.avatar, p.last_online, p.bg_from, p.bg_to
+                FROM friends f LEFT JOIN profiles p ON p.username = f.friend_username
+                WHERE f.owner_username = ?
+                ORDER BY f.friend_username
+                """,
+                (username,),
+            ).fetchall()
+            out["friends"] = [
+                {"username": r[0], "name": r[1], "avatar": r[2], "lastOnline": r[3], "bgFrom": r[4], "bgTo": r[5]}
+                for r in rows
+            ]
+        if "requests" in fields:
+            out["requests"] = friend_requests_for(conn, username)
+        if "library" in fields:
+            rows = conn.execute("SELECT game_id, game_name FROM library WHERE owner_username = ?", (username,)).fetchall()
+            out["library"] = [{"id": r[0], "name": r[1]} for r in rows]
+        if "channels" in fields:
+            out["channels"] = channels_for(conn, username)
+        for key in ("games", "store"):
+            if out.get(key) is not None:
+                out[key] = _mark_installed(out[key], username)
+    finally:
+        conn.commit()
+    if remote_games is not None:
+        out["games"] = _mark_installed(remote_games.result(), username)
+    if remote_store is not None:
+        out["store"] = _mark_installed(remote_store.result(), username)
     return jsonify(out)
 
-@app.route("/games/<game_id>")
-def game_details(game_id):
-    client_id = os.getenv("IGDB_CLIENT_ID")
-    access_token = ensure_igdb_token()
-    if client_id and access_token and requests is not None:
-        try:
-            q = f"fields name,summary,screenshots.image_id,videos.video_id; where id = {int(game_id)};"
-            resp = requests.post(
-                "https://api.igdb.com/v4/games",
-                data=q,
-                headers={
-                    "Client-ID": client_id,
-                    "Authorization": f"Bearer {access_token}",
-                },
-                timeout=8,
-            )
-            resp.raise_for_status()
-            arr = resp.json()
-            if arr:
-                g = arr[0]
-                images: List[str] = []
-                for s in (g.get("screenshots") or []):
-                    image_id = s.get("image_id")
-                    if image_id:
-                        images.append(f"https://images.igdb.com/igdb/image/upload/t_screenshot_big/{image_id}.jpg")
-                video_url = None
-                vids = g.get("videos") or []
-                if vids:
-                    vid = vids[0]
-                    yid = vid.get("video_id")
-                    if yid:
-                        video_url = f"https://www.youtube.com/embed/{yid}"
-                return jsonify(
-                    {
-                        "id": game_id,
-                        "name": g.get("name") or f"Game {game_id}",
-                        "summary": g.get("summary") or "",
-                        "screenshots": images or [
-                            "https://placehold.co/600x338/444/FFF?text=Gameplay+1"
-                        ],
-                        "videoUrl": video_url,
-                    }
-                )
-        except Exception as ex:
-            print("IGDB fetch failed:", ex)
-    return jsonify({
+# Cached marker for ids IGDB has no record of, so they are not refetched every view.
+_MISSING_GAME: dict = {}
+
+def _normalize_details(g: dict) -> dict:
+    gid = int(g.get("id"))
+    images: List[str] = []
+    for s in (g.get("screenshots") or []):
+        image_id = s.get("image_id")
+        if image_id:
+            images.append(image_url("screenshot", image_id))
+    video_url = None
+    vids = g.get("videos") or []
+    if vids:
+        vid = vids[0]
+        yid = vid.get("video_id")
+        if yid:
+            video_url = f"https://www.youtube.com/embed/{yid}"
+    return {
+        "id": gid,
+        "name": g.get("name") or f"Game {gid}",
+        "summary": g.get("summary") or "",
+        "screenshots": images or [
+            "https://placehold.co/600x338/444/FFF?text=Gameplay+1"
+        ],
+        "videoUrl": video_url,
+    }
+
+def _mock_details(game_id) -> dict:
+    return {
         "id": game_id,
         "name": f"Game {game_id}",
         "summary": "Mock summary. Plug IGDB here.",
@@ -863,7 +3697,141 @@ def game_details(game_id):
             "https://placehold.co/600x338/555/FFF?text=Gameplay+2",
         ],
         "videoUrl": None,
-    })
+    }
+
+def fetch_game_details(ids: List[int]) -> Dict[int, Optional[dict]]:
+    """Details for ``ids`` from the per-game cache, fetching all misses in one IGDB query."""
+    out: Dict[int, Optional[dict]] = {}
+    missing: List[int] = []
+    for gid in ids:
+        cached = game_details_cache.get(gid)
+        if cached is None:
+            missing.append(gid)
+        else:
+            out[gid] = cached or None
+    if missing:
+        q = (
+            "fields id,name,summary,screenshots.image_id,videos.video_id; "
+            f"where id = ({','.join(str(gid) for gid in missing)}); limit {len(missing)};"
+        )
+        found = {}
+        for g in igdb.query(q, name="details"):
+            if g.get("id"):
+                d = _normalize_details(g)
+                found[d["id"]] = d
+        for gid in missing:
+            d = found.get(gid)
+            game_details_cache.put(gid, d if d else _MISSING_GAME)
+            out[gid] = d
+    return out
+
+@app.route("/games/batch", methods=["GET"])
+def games_batch():
+    ids: List[int] = []
+    for part in (request.args.get("ids") or "").split(","):
+        part = part.strip()
+        if part.isdigit() and int(part) not in ids:
+            ids.append(int(part))
+    if not ids:
+        return jsonify({"error": "ids required"}), 400
+    if len(ids) > GAME_BATCH_MAX:
+        return jsonify({"error": f"at most {GAME_BATCH_MAX} ids"}), 400
+    details: Dict[int, Optional[dict]] = {}
+    if igdb.is_configured():
+        try:
+            details = fetch_game_details(ids)
+        except Exception as ex:
+            print("IGDB batch fetch failed:", ex)
+    return jsonify([details.get(gid) or _mock_details(gid) for gid in ids])
+
+@app.route("/games/<game_id>")
+def game_details(game_id):
+    if igdb.is_configured():
+        try:
+            d = fetch_game_details([int(game_id)]).get(int(game_id))
+            if d:
+                return jsonify(dict(d, id=game_id))
+        except Exception as ex:
+            print("IGDB fetch failed:", ex)
+    return jsonify(_mock_details(game_id))
+
+@app.route("/img/<variant>/<image_id>.jpg", methods=["GET"])
+def image_proxy(variant: str, image_id: str):
+    if variant not in IMAGE_VARIANTS or not image_id or len(image_id) > 64 or not set(image_id) <= IMAGE_ID_CHARS:
+        return jsonify({"error": "not found"}), 404
+    key = f"{variant}/{image_id}"
+    for _ in range(2):
+        try:
+            path, content_type, sha = image_flights.do(key, lambda: _fetch_image(variant, image_id))
+            resp = send_file(path, mimetype=content_type, etag=sha, max_age=IMAGE_MAX_AGE, conditional=True)
+        except FileNotFoundError:
+            # Evicted by another worker between lookup and open; fetch it again.
+            continue
+        except Exception as ex:
+            print("image proxy failed for", key, "->", ex)
+            break
+        resp.cache_control.immutable = True
+        return resp
+    # Better the uncached upstream image than a broken one.
+    return redirect(f"{IMAGE_BASE_URL}/{IMAGE_VARIANTS[variant][0]}/{image_id}.jpg")
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            route = request.url_rule.rule if has_request_context() and request.url_rule else "none"
+            metrics.observe("http_json_serialize_seconds", time.perf_counter() - started, route=route)
+
+app.json = TimedJSONProvider(app)
+
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, route=route, method=request.method)
+        metrics.inc("http_requests_total", route=route, method=request.method, status=response.status_code)
+    return response
+
+def _cache_samples():
+    caches = {
+        "catalog": catalog_cache,
+        "game_details": game_details_cache,
+        "owned_games": owned_games_cache,
+        "responses": response_cache,
+    }
+    for name, cache in caches.items():
+        st = cache.stats()
+        yield "cache_hits_total", "counter", "Cache hits, including stale hits.", {"cache": name}, st["hits"] + st["staleHits"]
+        yield "cache_misses_total", "counter", "Cache misses.", {"cache": name}, st["misses"]
+        yield "cache_hit_ratio", "gauge", "Cache hit ratio since start.", {"cache": name}, st["hitRatio"]
+        yield "cache_entries", "gauge", "Entries currently cached.", {"cache": name}, st["size"]
+
+def _runtime_samples():
+    sched = igdb.scheduler_stats()
+    yield "igdb_queue_depth", "gauge", "IGDB requests waiting for a rate-limit token.", {}, sched["queueDepth"]
+    yield "igdb_coalesced_total", "counter", "IGDB queries served by an in-flight identical query.", {}, sched["coalesced"]
+    yield "igdb_rejected_total", "counter", "IGDB requests that exceeded the queue timeout.", {}, sched["rejected"]
+    pool = db_pool.stats()
+    yield "sqlite_pool_idle", "gauge", "Idle pooled SQLite connections.", {}, pool["idle"]
+    yield "sqlite_pool_opened_total", "counter", "SQLite connections opened.", {}, pool["opened"]
+    broker = message_broker.stats()
+    yield "message_waiters", "gauge", "Long-poll requests waiting for messages.", {}, broker["waiters"]
+    job_stats = jobs.stats()
+    yield "job_queue_depth", "gauge", "Background jobs waiting for a worker.", {}, job_stats["depth"]
+
+metrics.collector(_cache_samples)
+metrics.collector(_runtime_samples)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/debug/igdb", methods=["GET"])
 def debug_igdb():
@@ -878,8 +3846,62 @@ def debug_igdb():
         status["can_fetch_token"] = bool(token)
     else:
         status["can_fetch_token"] = False
+    status["token_expires_in"] = igdb_tokens.expires_in()
+    status["token_refreshes"] = igdb_tokens.refresh_count
+    status["pool_size"] = igdb.pool_size
+    status["timeouts"] = igdb.timeouts
+    status["timings"] = igdb.timings()
+    status["scheduler"] = igdb.scheduler_stats()
+    status["catalog_cache"] = catalog_cache.stats()
+    status["game_details_cache"] = game_details_cache.stats()
+    status["owned_games_cache"] = owned_games_cache.stats()
+    status["response_cache"] = response_cache.stats()
+    status["image_cache"] = image_cache.stats()
+    status["presence"] = presence.stats()
+    status["message_writer"] = message_writer.stats()
+    status["message_archive"] = message_archiver.stats()
+    if MESSAGE_ARCHIVE_DAYS > 0 or os.path.exists(message_archive.path):
+        status["message_archive"]["store"] = message_archive.stats()
+    status["shared_cache"] = shared_cache.stats()
+    status["catalog_sync"] = catalog_sync.stats()
+    status["db_pool"] = db_pool.stats()
+    status["message_broker"] = message_broker.stats()
+    status["jobs"] = jobs.stats()
     return jsonify(status)
 
+_setup_lock = threading.Lock()
+_setup_done = False
+
+def create_app(start_background: bool = True) -> Flask:
+    """Run one-time setup and return the WSGI app."""
+    global _setup_done
+    with _setup_lock:
+        if not _setup_done:
+            init_db()
+            _setup_done = True
+    if start_background:
+        start_background_services()
+    return app
+
+def start_background_services() -> None:
+    catalog_sync.start()
+    presence.start()
+    if MESSAGE_ARCHIVE_DAYS > 0:
+        message_archiver.start()
+    if MESSAGE_POLL_INTERVAL > 0:
+        message_broker.start_polling(MESSAGE_POLL_INTERVAL)
+
 if __name__ == "__main__":
-    init_db()
+    if sys.argv[1:2] == ["backfill-search"]:
+        init_db()
+        backfill_message_search()
+        sys.exit(0)
+    if sys.argv[1:2] == ["archive-messages"]:
+        # python app.py archive-messages [DAYS]
+        init_db()
+        days = float(sys.argv[2]) if len(sys.argv) > 2 else (MESSAGE_ARCHIVE_DAYS or 90)
+        print(f"archived {message_archiver.run_once(days)} messages older than {days:g} days")
+        sys.exit(0)
+    # With the debug reloader only the child process serves requests.
+    create_app(start_background=os.environ.get("WERKZEUG_RUN_MAIN") == "true")
     app.run(host="0.0.0.0", port=4000, debug=True)
@@ -0,0 +1,171 @@
+"""Local stand-in for the IGDB games API and the Twitch OAuth token endpoint.
+
+Serves a deterministic synthetic catalog so app.py can be benchmarked without
+touching the real services. Point the app at it with:
+
+    IGDB_BASE_URL=http://127.0.0.1:<port>/v4
+    TWITCH_TOKEN_URL=http://127.0.0.1:<port>/oauth2/token
+    IGDB_CLIENT_ID=bench IGDB_CLIENT_SECRET=bench
+    IMAGE_BASE_URL=http://127.0.0.1:<port>/igdb/image/upload
+
+Only the parts of the apicalypse query language app.py sends are understood:
+``where id = (...)``, ``where updated_at > N | (updated_at = N & id > M)``,
+``sort <field> asc|desc``, ``limit`` and ``offset``.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def build_catalog(size: int) -> List[dict]:
+    games = []
+    for i in range(1, size + 1):
+        games.append(
+            {
+                "id": i,
+                "name": f"Bench Game {i}",
+                "cover": {"id": i, "image_id": f"co{i:06d}"},
+                "total_rating": float((i * 37) % 100),
+                "total_rating_count": float((size - i) * 3 % 5000),
+                "updated_at": 1_600_000_000 + i,
+                "summary": f"Synthetic summary for game {i}.",
+                "screenshots": [{"id": i, "image_id": f"sc{i:06d}"}],
+                "videos": [{"id": i, "video_id": "dQw4w9WgXcQ"}],
+                "version_parent": None if i % 20 else i - 1,
+            }
+        )
+    return games
+
+
+class FakeIgdb:
+    """Catalog, latency and optional rate cap shared by all request handlers."""
+
+    def __init__(self, catalog_size: int = 5000, latency_ms: float = 150.0, rate_limit: float = 0.0):
+        self.catalog = build_catalog(catalog_size)
+        self.by_id = {g["id"]: g for g in self.catalog}
+        self.latency = latency_ms / 1000.0
+        self.rate_limit = rate_limit
+        self._lock = threading.Lock()
+        self._window: List[float] = []
+        self.counts = {"token": 0, "games": 0, "images": 0, "throttled": 0}
+
+    def throttled(self) -> bool:
+        if self.rate_limit <= 0:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                self.counts["throttled"] += 1
+                return True
+            self._window.append(now)
+            return False
+
+    def bump(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def query(self, body: str) -> List[dict]:
+        rows = self.catalog
+        m = re.search(r"where id = \(([\d,\s]+)\)", body) or re.search(r"where id = (\d+)", body)
+        if m:
+            ids = [int(x) for x in m.group(1).split(",") if x.strip()]
+            rows = [self.by_id[i] for i in ids if i in self.by_id]
+        m = re.search(r"updated_at > (\d+) \| \(updated_at = \d+ & id > (\d+)\)", body)
+        if m:
+            since, since_id = int(m.group(1)), int(m.group(2))
+            rows = [g for g in rows if (g["updated_at"], g["id"]) > (since, since_id)]
+        if "version_parent = null" in body:
+            rows = [g for g in rows if g["version_parent"] is None]
+        m = re.search(r"sort (\w+) (asc|desc)", body)
+        if m:
+            field, direction = m.group(1), m.group(2)
+            rows = sorted(rows, key=lambda g: g.get(field) or 0, reverse=direction == "desc")
+        limit = int((re.search(r"limit (\d+)", body) or [None, "10"])[1])
+        offset = int((re.search(r"offset (\d+)", body) or [None, "0"])[1])
+        return rows[offset:offset + limit]
+
+
+def make_handler(state: FakeIgdb):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, payload) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8", "replace")
+            if self.path.startswith("/oauth2/token"):
+                state.bump("token")
+                time.sleep(state.latency)
+                self._send(200, {"access_token": f"bench-{time.time_ns()}", "expires_in": 5_000_000, "token_type": "bearer"})
+                return
+            if self.path.startswith("/v4/games"):
+                if state.throttled():
+                    self._send(429, {"message": "Too Many Requests"})
+                    return
+                state.bump("games")
+                time.sleep(state.latency)
+                self._send(200, state.query(body))
+                return
+            self._send(404, {"error": "not found"})
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send(200, dict(state.counts))
+                return
+            if self.path.startswith("/igdb/image/upload/"):
+                state.bump("images")
+                time.sleep(state.latency)
+                # Any bytes will do for the proxy; pad to a realistic cover size.
+                data = self.path.encode().ljust(64 * 1024, b"\0")
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self._send(404, {"error": "not found"})
+
+    return Handler
+
+
+def start(port: int = 0, catalog_size: int = 5000, latency_ms: float = 150.0, rate_limit: float = 0.0):
+    """Start the server on a daemon thread; returns ``(server, state)``."""
+    state = FakeIgdb(catalog_size, latency_ms, rate_limit)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-igdb", daemon=True).start()
+    return server, state
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--catalog", type=int, default=5000, help="number of synthetic games")
+    parser.add_argument("--latency-ms", type=float, default=150.0, help="added latency per upstream call")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="games requests/second before 429 (0 = off)")
+    args = parser.parse_args(argv)
+    server, _ = start(args.port, args.catalog, args.latency_ms, args.rate_limit)
+    print(f"fake IGDB listening on http://127.0.0.1:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
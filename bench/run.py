@@ -0,0 +1,444 @@
+"""Reproducible load benchmark for app.py against a local IGDB stand-in.
+
+Seeds a synthetic profiles.db (users, friendships, libraries, DM channels and
+messages), starts bench/fake_igdb.py, launches serve.py once per server
+configuration and drives a weighted mix of store scrolling, chat polling and
+sending, sign-ins and friend traffic. Prints p50/p95/p99 latency and req/s
+per endpoint for each configuration.
+
+    python bench/run.py --users 2000 --messages 2000000 --duration 30 \\
+        --config baseline --config "no-cache:CATALOG_CACHE_TTL=0,CATALOG_CACHE_STALE_TTL=0"
+
+The seeded database is cached in the work dir and reused while the seed
+parameters are unchanged; each configuration runs against a fresh copy.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+sys.path.insert(0, REPO)
+
+import fake_igdb  # noqa: E402
+
+SEED_CHUNK = 100_000
+DEFAULT_MIX = "store=35,chat_poll=30,chat_send=5,signin=5,friends=15,library=10"
+
+
+def username(i: int) -> str:
+    return f"u{i:06d}"
+
+
+def seed_database(path: str, users: int, friends: int, library: int, channels: int, messages: int, catalog: int) -> None:
+    """Build a synthetic profiles.db at ``path`` using the app's own migrations."""
+    import app as app_module
+
+    if os.path.exists(path):
+        os.remove(path)
+    app_module.migrate(path)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=MEMORY")
+    conn.execute("PRAGMA synchronous=OFF")
+    rnd = random.Random(1234)
+
+    def load(sql: str, rows, total: int, label: str) -> None:
+        started = time.perf_counter()
+        batch = []
+        done = 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= SEED_CHUNK:
+                conn.executemany(sql, batch)
+                done += len(batch)
+                batch.clear()
+                print(f"  {label}: {done:,}/{total:,}", end="\r", flush=True)
+        if batch:
+            conn.executemany(sql, batch)
+            done += len(batch)
+        conn.commit()
+        print(f"  {label}: {done:,} rows in {time.perf_counter() - started:.1f}s")
+
+    load(
+        "INSERT INTO profiles (name, username, avatar, last_online, bg_from, bg_to) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"User {i}", username(i), None, "Offline", "#ff7e5f", "#feb47b") for i in range(users)),
+        users,
+        "profiles",
+    )
+    half = max(1, friends // 2)
+
+    def friend_rows():
+        for i in range(users):
+            for k in range(1, half + 1):
+                j = (i + k) % users
+                if j != i:
+                    yield username(i), username(j)
+                    yield username(j), username(i)
+
+    load(
+        "INSERT OR IGNORE INTO friends (owner_username, friend_username) VALUES (?, ?)",
+        friend_rows(),
+        users * half * 2,
+        "friends",
+    )
+    load(
+        "INSERT OR IGNORE INTO library (owner_username, game_id, game_name) VALUES (?, ?, ?)",
+        (
+            (username(i), str(gid), f"Bench Game {gid}")
+            for i in range(users)
+            for gid in rnd.sample(range(1, catalog + 1), min(library, catalog))
+        ),
+        users * library,
+        "library",
+    )
+    channels = min(channels, users - 1)
+    # Channel c (1-based) is the DM between users c-1 and c.
+    load(
+        "INSERT INTO channels (id, name, created_by, dm_key) VALUES (?, ?, ?, ?)",
+        (
+            (c, f"dm:{username(c - 1)},{username(c)}", username(c - 1), f"dm:{username(c - 1)},{username(c)}")
+            for c in range(1, channels + 1)
+        ),
+        channels,
+        "channels",
+    )
+    load(
+        "INSERT INTO channel_members (channel_id, username) VALUES (?, ?)",
+        ((c, username(c - 1 + k)) for c in range(1, channels + 1) for k in (0, 1)),
+        channels * 2,
+        "channel_members",
+    )
+    now = time.time()
+
+    def message_rows():
+        for n in range(messages):
+            c = rnd.randint(1, channels)
+            # Spread history over the last year, oldest first.
+            ts = now - (messages - n) * (365 * 86400 / max(1, messages))
+            yield c, username(c - 1 + (n & 1)), f"message {n}", time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+    load(
+        "INSERT INTO messages (channel_id, sender, text, created_at) VALUES (?, ?, ?, ?)",
+        message_rows(),
+        messages,
+        "messages",
+    )
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def launch_server(
+    workdir: str, port: int, workers: int, env_overrides: Dict[str, str], igdb_url: str, log_path: str
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(
+        {
+            "IGDB_BASE_URL": f"{igdb_url}/v4",
+            "TWITCH_TOKEN_URL": f"{igdb_url}/oauth2/token",
+            "IGDB_CLIENT_ID": "bench",
+            "IGDB_CLIENT_SECRET": "bench",
+            # Keep the fake token, leases and caches out of the real instance directory.
+            "SHARED_CACHE_PATH": os.path.join(workdir, "cache.db"),
+            "ARCHIVE_DB_PATH": os.path.join(workdir, "archive.db"),
+            "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+            "PYTHONPATH": REPO + os.pathsep + env.get("PYTHONPATH", ""),
+        }
+    )
+    env.pop("IGDB_ACCESS_TOKEN", None)
+    env.update(env_overrides)
+    # The production entry point: preloaded gunicorn workers, each with its background services.
+    cmd = [sys.executable, os.path.join(REPO, "serve.py"), "--bind", f"127.0.0.1:{port}", "--workers", str(workers)]
+    log = open(log_path, "w")
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def catalog_synced(db_path: str) -> bool:
+    try:
+        conn = sqlite3.connect(db_path, timeout=1)
+        try:
+            return conn.execute("SELECT 1 FROM sync_state WHERE name = 'games_synced_at'").fetchone() is not None
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+
+
+def wait_ready(base: str, timeout: float, catalog_db: Optional[str]) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{base}/debug/igdb", timeout=2).raise_for_status()
+            # Any worker may answer, but only the sync leader has run; ask the database instead.
+            if not catalog_db or catalog_synced(catalog_db):
+                return
+        except Exception:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"server at {base} not ready after {timeout}s")
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def add(self, label: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class VirtualUser:
+    """One simulated client: a signed-in user with a store position and open chats."""
+
+    def __init__(self, base: str, idx: int, users: int, channels: int, rnd: random.Random, rec: Recorder):
+        self.base = base
+        self.idx = idx
+        self.name = username(idx)
+        self.users = users
+        self.rnd = rnd
+        self.rec = rec
+        self.http = requests.Session()
+        self.store_offset = 0
+        self.sort = rnd.choice(["popularity", "rating", "price_asc", "price_desc"])
+        # Users idx and idx+1 share channel idx+1; users past the last channel just poll channel 1.
+        self.channel = min(idx + 1, channels) if channels else 1
+        self.last_id = 0
+
+    def call(self, label: str, method: str, path: str, **kwargs) -> Optional[requests.Response]:
+        started = time.perf_counter()
+        ok = False
+        resp = None
+        try:
+            resp = self.http.request(method, self.base + path, timeout=30, **kwargs)
+            ok = resp.status_code < 500
+        except Exception:
+            ok = False
+        self.rec.add(label, time.perf_counter() - started, ok)
+        return resp
+
+    def store(self) -> None:
+        self.call(
+            "GET /store/games",
+            "GET",
+            f"/store/games?sort={self.sort}&limit=60&offset={self.store_offset}&username={self.name}",
+        )
+        self.store_offset = (self.store_offset + 60) % 600
+
+    def chat_poll(self) -> None:
+        if not self.last_id:
+            resp = self.call("GET /channels/:id/messages", "GET", f"/channels/{self.channel}/messages")
+        else:
+            resp = self.call(
+                "GET /channels/:id/messages?sinceId", "GET", f"/channels/{self.channel}/messages?sinceId={self.last_id}"
+            )
+        try:
+            rows = resp.json() if resp is not None else []
+            if rows:
+                self.last_id = max(self.last_id, rows[-1]["id"])
+        except Exception:
+            pass
+
+    def chat_send(self) -> None:
+        self.call(
+            "POST /channels/:id/messages",
+            "POST",
+            f"/channels/{self.channel}/messages",
+            json={"sender": self.name, "text": f"bench {self.rnd.random():.6f}"},
+        )
+
+    def signin(self) -> None:
+        self.call("POST /signin", "POST", "/signin", json={"username": self.name})
+
+    def friends(self) -> None:
+        self.call("GET /friends/:u", "GET", f"/friends/{self.name}")
+        self.call("GET /friend_requests/:u", "GET", f"/friend_requests/{self.name}")
+        other = username(self.rnd.randrange(self.users))
+        if other != self.name:
+            self.call("POST /friend_requests", "POST", "/friend_requests", json={"from": self.name, "to": other})
+
+    def library(self) -> None:
+        self.call("GET /library/:u", "GET", f"/library/{self.name}")
+
+
+def drive(base: str, users: int, channels: int, concurrency: int, duration: float, mix: List[Tuple[str, int]], seed: int) -> Tuple[Recorder, float]:
+    rec = Recorder()
+    stop = time.time() + duration
+    actions = [name for name, _ in mix]
+    weights = [w for _, w in mix]
+
+    def worker(n: int) -> None:
+        rnd = random.Random(seed + n)
+        vu = VirtualUser(base, rnd.randrange(users), users, channels, rnd, rec)
+        while time.time() < stop:
+            getattr(vu, rnd.choices(actions, weights)[0])()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return rec, time.perf_counter() - started
+
+
+def summarize(rec: Recorder, elapsed: float) -> List[dict]:
+    rows = []
+    for label in sorted(rec.samples):
+        vals = sorted(rec.samples[label])
+        rows.append(
+            {
+                "endpoint": label,
+                "count": len(vals),
+                "errors": rec.errors.get(label, 0),
+                "rps": len(vals) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(vals, 50) * 1000,
+                "p95_ms": percentile(vals, 95) * 1000,
+                "p99_ms": percentile(vals, 99) * 1000,
+            }
+        )
+    total = sum(r["count"] for r in rows)
+    everything = sorted(v for vals in rec.samples.values() for v in vals)
+    rows.append(
+        {
+            "endpoint": "ALL",
+            "count": total,
+            "errors": sum(rec.errors.values()),
+            "rps": total / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(everything, 50) * 1000,
+            "p95_ms": percentile(everything, 95) * 1000,
+            "p99_ms": percentile(everything, 99) * 1000,
+        }
+    )
+    return rows
+
+
+def print_table(name: str, rows: List[dict], upstream: dict) -> None:
+    print(f"\n== {name} ==  (upstream games calls: {upstream.get('games', 0)}, token calls: {upstream.get('token', 0)})")
+    print(f"{'endpoint':<38}{'count':>8}{'err':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in rows:
+        print(
+            f"{r['endpoint']:<38}{r['count']:>8}{r['errors']:>6}{r['rps']:>9.1f}"
+            f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+        )
+
+
+def parse_config(spec: str) -> Tuple[str, Dict[str, str]]:
+    name, _, rest = spec.partition(":")
+    env = {}
+    for part in filter(None, rest.split(",")):
+        k, _, v = part.partition("=")
+        env[k.strip()] = v.strip()
+    return name.strip() or "config", env
+
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    mix = []
+    for part in filter(None, spec.split(",")):
+        k, _, v = part.partition("=")
+        if not hasattr(VirtualUser, k.strip()):
+            raise SystemExit(f"unknown action in --mix: {k}")
+        mix.append((k.strip(), int(v or 1)))
+    return mix
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark app.py against a local IGDB stand-in.")
+    parser.add_argument("--workdir", default=os.path.join(HERE, "work"), help="where seeded databases and logs live")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--friends", type=int, default=20, help="friends per user")
+    parser.add_argument("--library", type=int, default=10, help="library games per user")
+    parser.add_argument("--channels", type=int, default=500, help="DM channels")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--catalog", type=int, default=5000, help="fake IGDB catalog size")
+    parser.add_argument("--igdb-latency-ms", type=float, default=150.0)
+    parser.add_argument("--igdb-rate-limit", type=float, default=4.0, help="fake IGDB req/s before 429 (0 = off)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes (serve.py --workers)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per configuration")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"action weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--config", action="append", default=[], help="NAME[:ENV=VAL,...]; repeat to compare")
+    parser.add_argument("--no-warm", action="store_true", help="don't wait for the first catalog sync")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the seeded database")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    template = os.path.join(args.workdir, "seed.db")
+    params = {k: getattr(args, k) for k in ("users", "friends", "library", "channels", "messages", "catalog")}
+    params_path = template + ".json"
+    cached = None
+    if os.path.exists(params_path):
+        with open(params_path) as f:
+            cached = json.load(f)
+    if args.reseed or cached != params or not os.path.exists(template):
+        print(f"Seeding {template} with {params}")
+        seed_database(template, **params)
+        with open(params_path, "w") as f:
+            json.dump(params, f)
+
+    server, state = fake_igdb.start(0, args.catalog, args.igdb_latency_ms, args.igdb_rate_limit)
+    igdb_url = f"http://127.0.0.1:{server.server_address[1]}"
+    mix = parse_mix(args.mix)
+    configs = [parse_config(c) for c in (args.config or ["baseline"])]
+    results = {}
+    for name, env in configs:
+        rundir = os.path.join(args.workdir, name)
+        shutil.rmtree(rundir, ignore_errors=True)
+        os.makedirs(rundir)
+        shutil.copyfile(template, os.path.join(rundir, "profiles.db"))
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        before = dict(state.counts)
+        db_path = os.path.join(rundir, "profiles.db")
+        proc = launch_server(rundir, port, args.workers, env, igdb_url, os.path.join(rundir, "server.log"))
+        try:
+            wait_ready(base, 120, None if args.no_warm else db_path)
+            rec, elapsed = drive(base, args.users, min(args.channels, args.users - 1), args.concurrency, args.duration, mix, args.seed)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        upstream = {k: state.counts[k] - before.get(k, 0) for k in state.counts}
+        rows = summarize(rec, elapsed)
+        print_table(f"{name} {env or ''}".strip(), rows, upstream)
+        results[name] = {"env": env, "elapsed": elapsed, "upstream": upstream, "endpoints": rows}
+    server.shutdown()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": params, "args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
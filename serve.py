@@ -0,0 +1,55 @@
+"""Production entry point: gunicorn gthread workers over a preloaded app.
+
+    python serve.py --workers 4 --threads 32 --bind 0.0.0.0:4000
+
+The app is imported and migrated once in the master before forking; each
+worker then starts its own background threads. IGDB token and catalog data
+are shared between workers through SHARED_CACHE_PATH. Without gunicorn
+(e.g. on Windows) this falls back to a single threaded Werkzeug process.
+"""
+import argparse
+import os
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the API with multiple worker processes.")
+    parser.add_argument("--bind", default=os.getenv("WEB_BIND", "0.0.0.0:4000"))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 2))))
+    # Long-polls hold a thread each for up to MESSAGE_WAIT_MAX seconds.
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "32")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "60")))
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        # Long-poll waiters must also hear about messages other workers insert.
+        os.environ.setdefault("MESSAGE_POLL_INTERVAL", "0.25")
+    import app as app_module
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("gunicorn not installed; serving with a single threaded process")
+        host, _, port = args.bind.rpartition(":")
+        app_module.create_app().run(host=host or "0.0.0.0", port=int(port), threaded=True)
+        return
+
+    application = app_module.create_app(start_background=False)
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", args.bind)
+            self.cfg.set("workers", max(1, args.workers))
+            self.cfg.set("threads", max(1, args.threads))
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("timeout", args.timeout)
+            self.cfg.set("preload_app", True)
+            self.cfg.set("post_fork", lambda server, worker: app_module.start_background_services())
+
+        def load(self):
+            return application
+
+    Server().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { Plus } from "lucide-react";
 import ProfileCard from "./components/profile.jsx";
 
@@ -7,15 +7,41 @@ export default function App() {
   const [activeIndex, setActiveIndex] = useState(0);
   const [plusHeight, setPlusHeight] = useState(null);
 
+  const [nextCursor, setNextCursor] = useState(null);
+  const loadingMoreRef = useRef(false);
+
+  // First page in one bootstrap call; later pages load as the selection reaches the end.
   useEffect(() => {
-    fetch("/api/profiles")
+    let cancelled = false;
+    fetch("/api/bootstrap?fields=profiles")
       .then((res) => res.json())
       .then((data) => {
-        setProfiles(data);
+        if (cancelled) return;
+        setProfiles(Array.isArray(data.profiles?.items) ? data.profiles.items : []);
+        setNextCursor(data.profiles?.nextCursor || null);
         setActiveIndex(0);
-      });
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
   }, []);
 
+  useEffect(() => {
+    if (!nextCursor || loadingMoreRef.current || activeIndex < profiles.length - 1) return;
+    loadingMoreRef.current = true;
+    fetch(`/api/profiles?limit=100&cursor=${encodeURIComponent(nextCursor)}`)
+      .then((res) => res.json())
+      .then((data) => {
+        setProfiles((prev) => [...prev, ...(Array.isArray(data.items) ? data.items : [])]);
+        setNextCursor(data.nextCursor || null);
+      })
+      .catch(() => {})
+      .finally(() => {
+        loadingMoreRef.current = false;
+      });
+  }, [activeIndex, profiles.length, nextCursor]);
+
   useEffect(() => {
     const handleKeyDown = (e) => {
       if (e.key.toLowerCase() === "a") {
@@ -0,0 +1,27 @@
+// First-paint data for the signed-in pages, fetched once in a single /bootstrap call.
+// Each field is handed out once; later loads (refreshes, paging, other sorts) use the
+// regular endpoints so they never see stale data.
+const FIELDS = "friends,requests,games,store";
+
+let pending = null;
+let pendingUser = null;
+const taken = new Set();
+
+export function loadBootstrap(username) {
+  if (!username) return Promise.resolve(null);
+  if (pendingUser !== username) {
+    pendingUser = username;
+    taken.clear();
+    pending = fetch(`/api/bootstrap/${encodeURIComponent(username)}?fields=${FIELDS}`)
+      .then((r) => (r.ok ? r.json() : null))
+      .catch(() => null);
+  }
+  return pending;
+}
+
+// Resolves to the field's value the first time it is asked for, then to null.
+export function takeBootstrap(username, field) {
+  if (!username || taken.has(field)) return Promise.resolve(null);
+  taken.add(field);
+  return loadBootstrap(username).then((data) => (data && data[field] !== undefined ? data[field] : null));
+}
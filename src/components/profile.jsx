@@ -1,4 +1,5 @@
 import React from "react";
+import { formatLastSeen } from "../lastSeen";
 
 export default function ProfileCard({
   avatar,
@@ -66,7 +67,7 @@ export default function ProfileCard({
         @{username}
       </p>
       <p style={{ margin: "5px 0", fontSize: "0.8em", opacity: 0.7 }}>
-        {lastOnline}
+        {formatLastSeen(lastOnline)}
       </p>
       {isActive && (
         <button
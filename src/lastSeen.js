@@ -0,0 +1,15 @@
+// Human-readable form of a presence timestamp ("2026-01-02T03:04:05Z").
+// Anything that is not a timestamp (older rows say "Online now") is shown as-is.
+export function formatLastSeen(value) {
+  if (!value) return "Offline";
+  const t = Date.parse(value);
+  if (Number.isNaN(t)) return value;
+  const mins = Math.floor((Date.now() - t) / 60000);
+  if (mins < 2) return "Last seen just now";
+  if (mins < 60) return `Last seen ${mins}m ago`;
+  const hours = Math.floor(mins / 60);
+  if (hours < 24) return `Last seen ${hours}h ago`;
+  const days = Math.floor(hours / 24);
+  if (days < 30) return `Last seen ${days}d ago`;
+  return `Last seen ${new Date(t).toLocaleDateString()}`;
+}
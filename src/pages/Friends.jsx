@@ -1,5 +1,7 @@
 import React from "react";
 import { useNavigate } from "react-router-dom";
+import { formatLastSeen } from "../lastSeen";
+import { takeBootstrap } from "../bootstrap";
 
 // Friends page now contains full Social (friends + requests + DM chat)
 export default function Friends() {
@@ -10,30 +12,22 @@ export default function Friends() {
   const [outgoing, setOutgoing] = React.useState([]);
   const [search, setSearch] = React.useState("");
   const [addName, setAddName] = React.useState("");
+  const [suggestions, setSuggestions] = React.useState([]);
+  const pickedRef = React.useRef("");
   const navigate = useNavigate();
 
   const [activeFriend, setActiveFriend] = React.useState(null);
   const [channelId, setChannelId] = React.useState(null);
   const [messages, setMessages] = React.useState([]);
+  const [olderCursor, setOlderCursor] = React.useState(null);
   const [text, setText] = React.useState("");
   const listEndRef = React.useRef(null);
-  const pollRef = React.useRef(null);
   const lastIdRef = React.useRef(0);
+  // A send that failed keeps its clientId, so pressing Send again can't post it twice.
+  const pendingSendRef = React.useRef(null);
   const [visible, setVisible] = React.useState(typeof document !== "undefined" ? document.visibilityState === "visible" : true);
 
-  const gamePool = React.useMemo(
-    () => [
-      { id: 1001, name: "Neon Rift" },
-      { id: 1002, name: "Arcane Runner" },
-      { id: 1003, name: "Starforge" },
-      { id: 1004, name: "Shadow Vale" },
-      { id: 1005, name: "Eclipse Odyssey" },
-      { id: 1006, name: "Crimson Tactics" },
-    ],
-    []
-  );
-  const [playingMap, setPlayingMap] = React.useState({});
-  const rngPick = React.useCallback(() => gamePool[Math.floor(Math.random() * gamePool.length)], [gamePool]);
+  const [presenceMap, setPresenceMap] = React.useState({});
 
   const loadFriends = React.useCallback(() => {
     if (!user?.username) return;
@@ -57,18 +51,62 @@ export default function Friends() {
       });
   }, [user]);
 
-  React.useEffect(() => { loadFriends(); loadRequests(); }, [loadFriends, loadRequests]);
-
-  React.useEffect(() => {
-    if (!friends.length) return;
-    setPlayingMap((prev) => {
-      const next = { ...prev };
-      for (const f of friends) {
-        if (!next[f.username]) next[f.username] = rngPick();
+  // Initial load: friends and requests come with the shared bootstrap call.
+  const loadSocial = React.useCallback(() => {
+    if (!user?.username) return;
+    Promise.all([takeBootstrap(user.username, "friends"), takeBootstrap(user.username, "requests")]).then(([rows, requests]) => {
+      if (rows) setFriends(rows);
+      else loadFriends();
+      if (requests) {
+        setIncoming(Array.isArray(requests.incoming) ? requests.incoming : []);
+        setOutgoing(Array.isArray(requests.outgoing) ? requests.outgoing : []);
+      } else {
+        loadRequests();
       }
-      return next;
     });
-  }, [friends, rngPick]);
+  }, [user, loadFriends, loadRequests]);
+
+  React.useEffect(() => { loadSocial(); }, [loadSocial]);
+
+  const loadPresence = React.useCallback(() => {
+    if (!user?.username) return;
+    fetch(`/api/presence?friendsOf=${encodeURIComponent(user.username)}`)
+      .then((r) => r.json())
+      .then((data) => {
+        const next = {};
+        for (const p of Array.isArray(data.items) ? data.items : []) next[p.username] = p;
+        setPresenceMap(next);
+      })
+      .catch(() => {});
+  }, [user]);
+
+  React.useEffect(() => {
+    if (!friends.length || !visible) return;
+    loadPresence();
+    const timer = setInterval(loadPresence, 30000);
+    return () => clearInterval(timer);
+  }, [friends, visible, loadPresence]);
+
+  React.useEffect(() => {
+    const q = addName.trim();
+    if (!q || !user?.username || q === pickedRef.current) {
+      setSuggestions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(() => {
+      fetch(`/api/profiles/search?q=${encodeURIComponent(q)}&username=${encodeURIComponent(user.username)}&limit=8`, {
+        signal: controller.signal,
+      })
+        .then((r) => r.json())
+        .then((data) => setSuggestions(Array.isArray(data.items) ? data.items : []))
+        .catch(() => {});
+    }, 200);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [addName, user]);
 
   const addFriend = async () => {
     if (!addName.trim() || !user?.username) return;
@@ -79,6 +117,7 @@ export default function Friends() {
     });
     if (res.ok) {
       setAddName("");
+      setSuggestions([]);
       loadRequests();
     }
   };
@@ -86,10 +125,7 @@ export default function Friends() {
   const acceptRequest = async (reqId) => {
     if (!reqId) return;
     const res = await fetch(`/api/friend_requests/${reqId}/accept`, { method: "POST" });
-    if (res.ok) {
-      loadFriends();
-      loadRequests();
-    }
+    if (res.ok) loadSocial();
   };
 
   const declineRequest = async (reqId) => {
@@ -102,30 +138,50 @@ export default function Friends() {
 
   const ensureDmChannel = async (friendName) => {
     if (!user?.username || !friendName) return null;
-    const a = user.username;
-    const b = friendName;
-    const dmName = `dm:${[a, b].sort().join(",")}`;
-    const res = await fetch(`/api/channels/${encodeURIComponent(user.username)}`);
-    const chans = await res.json();
-    let dm = chans.find((c) => c.name === dmName);
-    if (!dm) {
-      const cRes = await fetch(`/api/channels`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ name: dmName, createdBy: user.username, members: [friendName] }),
-      });
-      if (cRes.ok) dm = await cRes.json();
-    }
+    const res = await fetch(`/api/channels/dm`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ username: user.username, friend: friendName }),
+    });
+    if (!res.ok) return null;
+    const dm = await res.json();
     return dm?.id || null;
   };
 
   const loadMessages = React.useCallback(async () => {
     if (!channelId) return;
-    const res = await fetch(`/api/channels/${channelId}/messages`);
-    const list = await res.json();
-    setMessages(list);
+    const res = await fetch(`/api/channels/${channelId}/messages?limit=50`);
+    const page = await res.json();
+    setMessages(Array.isArray(page.items) ? page.items : []);
+    setOlderCursor(page.nextCursor || null);
   }, [channelId]);
 
+  const loadOlder = async () => {
+    if (!channelId || !olderCursor) return;
+    const res = await fetch(`/api/channels/${channelId}/messages?limit=50&cursor=${encodeURIComponent(olderCursor)}`);
+    if (!res.ok) return;
+    const page = await res.json();
+    const older = Array.isArray(page.items) ? page.items : [];
+    setMessages((prev) => {
+      const first = prev.length ? prev[0].id : Infinity;
+      return [...older.filter((m) => m.id < first), ...prev];
+    });
+    setOlderCursor(page.nextCursor || null);
+  };
+
+  // Merge by id, keeping id order (a send's response and the long-poll can arrive in either order).
+  const appendMessages = React.useCallback((more) => {
+    if (!Array.isArray(more) || !more.length) return;
+    setMessages((prev) => {
+      const seen = new Set(prev.map((m) => m.id));
+      const fresh = more.filter((m) => !seen.has(m.id));
+      if (!fresh.length) return prev;
+      const last = prev.length ? prev[prev.length - 1].id : 0;
+      const merged = [...prev, ...fresh];
+      return fresh.every((m) => m.id > last) ? merged : merged.sort((a, b) => a.id - b.id);
+    });
+  }, []);
+
   React.useEffect(() => { loadMessages(); }, [loadMessages]);
   React.useEffect(() => { lastIdRef.current = messages.length ? messages[messages.length - 1].id : 0; }, [messages]);
 
@@ -135,22 +191,38 @@ export default function Friends() {
     return () => document.removeEventListener("visibilitychange", handler);
   }, []);
 
+  // Long-poll: the server holds the request until a new message arrives or `wait` seconds pass.
   React.useEffect(() => {
     if (!channelId || !visible) return;
-    if (pollRef.current) clearInterval(pollRef.current);
-    pollRef.current = setInterval(async () => {
-      const res = await fetch(`/api/channels/${channelId}/messages?sinceId=${lastIdRef.current}`);
-      if (res.ok) {
-        const more = await res.json();
-        if (more.length) setMessages((prev) => [...prev, ...more]);
+    const ctrl = new AbortController();
+    let stopped = false;
+    (async () => {
+      while (!stopped) {
+        try {
+          const res = await fetch(
+            `/api/channels/${channelId}/messages?sinceId=${lastIdRef.current}&wait=25`,
+            { signal: ctrl.signal }
+          );
+          if (!res.ok) throw new Error(`HTTP ${res.status}`);
+          const more = await res.json();
+          if (more.length) {
+            lastIdRef.current = Math.max(lastIdRef.current, more[more.length - 1].id);
+            appendMessages(more);
+          }
+        } catch {
+          if (stopped) return;
+          await new Promise((r) => setTimeout(r, 3000));
+        }
       }
-    }, 10000);
-    return () => { if (pollRef.current) clearInterval(pollRef.current); };
-  }, [channelId, visible]);
+    })();
+    return () => { stopped = true; ctrl.abort(); };
+  }, [channelId, visible, appendMessages]);
 
+  // Only follow the bottom when new messages arrive, not when older history is prepended.
+  const newestId = messages.length ? messages[messages.length - 1].id : 0;
   React.useEffect(() => {
     listEndRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [messages]);
+  }, [newestId]);
 
   const openChat = async (friend) => {
     setActiveFriend(friend.username);
@@ -160,16 +232,27 @@ export default function Friends() {
 
   const send = async () => {
     if (!text.trim() || !channelId || !user?.username) return;
-    await fetch(`/api/channels/${channelId}/messages`, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ sender: user.username, text }),
-    });
+    let pending = pendingSendRef.current;
+    if (!pending || pending.channelId !== channelId || pending.text !== text) {
+      const clientId = window.crypto?.randomUUID?.() || `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+      pending = { channelId, text, clientId };
+      pendingSendRef.current = pending;
+    }
+    let res;
+    try {
+      res = await fetch(`/api/channels/${channelId}/messages`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ sender: user.username, text, clientId: pending.clientId }),
+      });
+    } catch {
+      return;
+    }
+    if (!res.ok) return;
+    pendingSendRef.current = null;
     setText("");
-    const lastId = messages.length ? messages[messages.length - 1].id : 0;
-    const res = await fetch(`/api/channels/${channelId}/messages?sinceId=${lastId}`);
-    const more = await res.json();
-    setMessages((prev) => [...prev, ...more]);
+    // The response is the stored message; earlier ones from the friend arrive via the long-poll.
+    appendMessages([await res.json()]);
   };
 
   const filteredFriends = React.useMemo(() => {
@@ -258,6 +341,35 @@ export default function Friends() {
             Add
           </button>
         </div>
+        {suggestions.length && addName.trim() ? (
+          <div style={{
+            border: "1px solid #333",
+            borderRadius: 8,
+            marginTop: -6,
+            marginBottom: 12,
+            overflow: "hidden"
+          }}>
+            {suggestions.map((p) => (
+              <div
+                key={p.username}
+                onClick={() => { pickedRef.current = p.username; setAddName(p.username); setSuggestions([]); }}
+                style={{
+                  display: "flex",
+                  justifyContent: "space-between",
+                  padding: "6px 10px",
+                  background: "#151515",
+                  cursor: "pointer",
+                  fontSize: 13
+                }}
+              >
+                <span>{p.name} <span style={{ color: "#888" }}>@{p.username}</span></span>
+                <span style={{ color: "#888" }}>
+                  {p.relation === "friend" ? "Friend" : p.mutualFriends ? `${p.mutualFriends} mutual` : ""}
+                </span>
+              </div>
+            ))}
+          </div>
+        ) : null}
 
         {/* Friend Requests */}
         {(incoming.length || outgoing.length) ? (
@@ -296,7 +408,8 @@ export default function Friends() {
 
         <div style={{ display: "flex", flexDirection: "column", gap: 8 }}>
           {filteredFriends.map((f) => {
-            const g = playingMap[f.username] || gamePool[0];
+            const p = presenceMap[f.username];
+            const g = p?.game;
             const isActive = activeFriend === f.username;
             return (
               <div 
@@ -321,7 +434,7 @@ export default function Friends() {
                       width: 8, 
                       height: 8, 
                       borderRadius: "50%", 
-                      background: "#4caf50", 
+                      background: p?.online ? "#4caf50" : "#666", 
                       display: "inline-block" 
                     }} />
                     <div style={{ 
@@ -337,22 +450,28 @@ export default function Friends() {
                   opacity: 0.9,
                   color: "#fff"
                 }}>
-                  Playing: {" "}
-                  <button
-                    title={`View ${g.name}`}
-                    onClick={(e) => { e.stopPropagation(); navigate(`/home/games/${g.id}`); }}
-                    style={{ 
-                      textDecoration: "underline", 
-                      color: "#8ab4f8", 
-                      background: "transparent", 
-                      border: "none", 
-                      padding: 0, 
-                      cursor: "pointer",
-                      fontSize: 13
-                    }}
-                  >
-                    {g.name}
-                  </button>
+                  {g ? (
+                    <>
+                      Playing: {" "}
+                      <button
+                        title={`View ${g.name}`}
+                        onClick={(e) => { e.stopPropagation(); navigate(`/home/games/${g.id}`); }}
+                        style={{ 
+                          textDecoration: "underline", 
+                          color: "#8ab4f8", 
+                          background: "transparent", 
+                          border: "none", 
+                          padding: 0, 
+                          cursor: "pointer",
+                          fontSize: 13
+                        }}
+                      >
+                        {g.name}
+                      </button>
+                    </>
+                  ) : (
+                    <span style={{ opacity: 0.7 }}>{p?.online ? "Online" : formatLastSeen(p?.lastSeen || f.lastOnline)}</span>
+                  )}
                 </div>
               </div>
             );
@@ -406,6 +525,23 @@ export default function Friends() {
           flexDirection: "column",
           gap: 8
         }}>
+          {olderCursor ? (
+            <button
+              onClick={loadOlder}
+              style={{
+                alignSelf: "center",
+                background: "transparent",
+                color: "#9ab",
+                border: "1px solid #333",
+                borderRadius: 8,
+                padding: "4px 10px",
+                fontSize: 12,
+                cursor: "pointer"
+              }}
+            >
+              Load older messages
+            </button>
+          ) : null}
           {messages.map((m) => {
             const me = (user?.username || "").toLowerCase();
             const sender = String(m.sender || "");
@@ -64,6 +64,8 @@ export default function GameDetails() {
               if (launching) return;
               setLaunching(true);
               setTimeout(() => setLaunching(false), 5000);
+              sessionStorage.setItem("currentGame", JSON.stringify({ id: Number(gameId), name: game.name }));
+              window.dispatchEvent(new Event("presence:beat"));
             }}
             disabled={launching}
             style={{
@@ -1,6 +1,7 @@
 import React from "react";
 import { Link } from "react-router-dom";
 import { Plus } from "lucide-react";
+import { takeBootstrap } from "../bootstrap";
 
 export default function Games() {
   const [games, setGames] = React.useState([]);
@@ -14,8 +15,9 @@ export default function Games() {
     // Run once on mount; avoid coupling to `loading` to prevent effect loops.
     setLoading(true);
     const LIMIT = 60;
-    fetch(`/api/games?limit=${LIMIT}&offset=0`)
-      .then((r) => r.json())
+    const user = JSON.parse(localStorage.getItem("currentUser") || "null");
+    takeBootstrap(user?.username, "games")
+      .then((first) => first || fetch(`/api/games?limit=${LIMIT}&offset=0`).then((r) => r.json()))
       .then((list) => {
         if (Array.isArray(list)) setGames(list);
         else setGames([]);
@@ -106,6 +108,7 @@ export default function Games() {
                 <div style={{ background: "#0f0f0f" }}>
                   <img
                     src={g.coverUrl}
+                    srcSet={g.coverUrl2x ? `${g.coverUrl} 1x, ${g.coverUrl2x} 2x` : undefined}
                     alt={g.name}
                     style={{
                       width: "100%",
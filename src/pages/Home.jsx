@@ -1,6 +1,7 @@
 import React from "react";
 import { Outlet, NavLink, useNavigate } from "react-router-dom";
 import { Gamepad2, AppWindow, ShoppingBag, Users } from "lucide-react";
+import { loadBootstrap } from "../bootstrap";
 
 const linkStyle = ({ isActive }) => ({
   width: 48,
@@ -23,6 +24,36 @@ export default function HomeLayout() {
     if (!user) navigate("/");
   }, [user, navigate]);
 
+  // Presence heartbeat while the app is open; Play on a game page sets the current game.
+  const username = user?.username;
+  // Start the first-paint request before the child page mounts.
+  React.useEffect(() => {
+    loadBootstrap(username);
+  }, [username]);
+  React.useEffect(() => {
+    if (!username) return;
+    const beat = () => {
+      let game = null;
+      try {
+        game = JSON.parse(sessionStorage.getItem("currentGame") || "null");
+      } catch {
+        game = null;
+      }
+      fetch(`/api/presence/heartbeat`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ username, gameId: game?.id ?? null, gameName: game?.name ?? null }),
+      }).catch(() => {});
+    };
+    beat();
+    const timer = setInterval(beat, 30000);
+    window.addEventListener("presence:beat", beat);
+    return () => {
+      clearInterval(timer);
+      window.removeEventListener("presence:beat", beat);
+    };
+  }, [username]);
+
   return (
     <div style={{ display: "flex", minHeight: "100vh", width: "100%" }}>
       <aside
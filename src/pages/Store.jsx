@@ -1,5 +1,6 @@
 import React from "react";
 import { Link, useNavigate } from "react-router-dom";
+import { takeBootstrap } from "../bootstrap";
 
 export default function Store() {
   const navigate = useNavigate();
@@ -35,8 +36,10 @@ export default function Store() {
     const username = user && user.username ? `&username=${encodeURIComponent(user.username)}` : "";
     const sortParam = encodeURIComponent(sortRef.current);
 
-    fetch(`/api/store/games?sort=${sortParam}&limit=${PAGE_SIZE}&offset=${offset}${username}`)
-      .then((r) => r.json())
+    // The first page for the default sort comes with the bootstrap.
+    const first = offset === 0 && sortRef.current === "rating" ? takeBootstrap(user?.username, "store") : Promise.resolve(null);
+    first
+      .then((list) => list || fetch(`/api/store/games?sort=${sortParam}&limit=${PAGE_SIZE}&offset=${offset}${username}`).then((r) => r.json()))
       .then((list) => {
         if (Array.isArray(list)) {
           setGames((prev) => {
@@ -180,7 +183,7 @@ export default function Store() {
             >
               <Link to={`/home/games/${g.id}`} style={{ textDecoration: "none", color: "inherit" }}>
                 <div style={{ background: "#0f0f0f", position: "relative" }}>
-                  <img src={g.coverUrl} alt={g.name} style={{ width: "100%", height: "auto", display: "block" }} />
+                  <img src={g.coverUrl} srcSet={g.coverUrl2x ? `${g.coverUrl} 1x, ${g.coverUrl2x} 2x` : undefined} alt={g.name} style={{ width: "100%", height: "auto", display: "block" }} />
                   {g.installed ? (
                     <div style={{ position: "absolute", top: 8, left: 8, background: "#2e7d32", color: "#fff", padding: "2px 6px", borderRadius: 6, fontSize: 12 }}>
                       Owned
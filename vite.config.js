@@ -12,6 +12,11 @@ export default defineConfig({
         target: "http://127.0.0.1:4000",
         changeOrigin: true,
         rewrite: (path) => path.replace(/^\/api/, "")
+      },
+      // Cover URLs point at the backend's own /img route.
+      "/img": {
+        target: "http://127.0.0.1:4000",
+        changeOrigin: true
       }
     }
   }